@@ -0,0 +1,45 @@
+import os
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+
+def generate_aes_key():
+    """Genera una chiave AES casuale di 32 byte evitando spazi vuoti."""
+    while True:
+        key = os.urandom(32)
+        if not any(b == 32 for b in key):  # Evita chiavi con byte di spazio (32)
+            return key
+
+
+def generate_aes_iv():
+    """Genera un vettore di inizializzazione (IV) AES casuale di 16 byte evitando spazi vuoti."""
+    while True:
+        iv = os.urandom(16)
+        if not any(b == 32 for b in iv):
+            return iv
+
+
+def encrypt_id_aes(id_bytes, iv, key):
+    """Cifra un ID utilizzando AES in modalità CFB."""
+    cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
+    encryptor = cipher.encryptor()
+
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    padded_data = padder.update(id_bytes) + padder.finalize()
+
+    ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+    return ciphertext
+
+
+def decrypt_id_aes(ciphertext, iv, key):
+    """Decifra un ID utilizzando AES in modalità CFB."""
+    cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
+    decryptor = cipher.decryptor()
+
+    padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
+
+    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+    plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
+    return plaintext
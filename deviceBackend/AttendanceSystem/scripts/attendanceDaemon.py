@@ -0,0 +1,524 @@
+import sys
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from syncEngine import SyncEngine
+from keyChain import create_keychain
+from recordCodec import encode_bytes, decode_bytes
+from aesCipher import generate_aes_key, generate_aes_iv, encrypt_id_aes
+from outbox import Outbox, TARGET_SHEETS, TARGET_BLOCKCHAIN
+from courseDatabase import course_pool, insert_students
+from sessionRoster import StudentRoster, SessionAttendance
+
+# Indirizzo dell'API di controllo locale
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = 8765
+# Numero di esiti delle scansioni conservati per i client
+SCAN_LOG_SIZE = 500
+# Thread usati per preparare in parallelo foglio, studenti e conteggio dei record di una sessione
+BOOTSTRAP_WORKERS = 3
+
+OPERATION_SHEET_TYPES = {"Registrazione": "R", "Lezione": "L", "Esame": "E"}
+
+# Esiti di una scansione
+SCAN_ACCEPTED = 'accepted'
+SCAN_DUPLICATE = 'duplicate'
+SCAN_UNKNOWN = 'unknown'
+SCAN_REJECTED = 'rejected'
+# Scansione ricevuta durante la preparazione della sessione, gestita appena questa termina
+SCAN_QUEUED = 'queued'
+
+
+class DaemonError(ValueError):
+    """Richiesta non valida per lo stato attuale del daemon."""
+
+
+class AttendanceSession:
+    """Stato di una sessione di registrazione, lezione o esame in corso."""
+
+    def __init__(self, operation_type, course_name, name):
+        self.operation_type = operation_type
+        self.course_name = course_name
+        self.name = name
+        self.database = f"{course_name}.db"
+        self.key = None
+        self.iv = None
+        self.outbox = None
+        self.roster = None
+        self.attendance = None
+        # Dati dello studente che verrà associato al prossimo tag in una registrazione
+        self.pending_student = None
+        self.started_at = time.time()
+        self.accepted = 0
+        # Impostato al termine della preparazione; fino ad allora le scansioni restano in coda
+        self.ready = threading.Event()
+        self.bootstrap_error = None
+        self.queued_scans = []
+
+    def to_dict(self):
+        return {
+            'operation': self.operation_type,
+            'course': self.course_name,
+            'name': self.name,
+            'started_at': self.started_at,
+            'accepted': self.accepted,
+            'present': len(self.attendance) if self.attendance is not None else None,
+            'roster_size': len(self.roster) if self.roster is not None else None,
+            'pending_student': self.pending_student is not None,
+            'ready': self.ready.is_set(),
+            'bootstrap_error': self.bootstrap_error,
+            'queued_scans': len(self.queued_scans)
+        }
+
+
+class AttendanceDaemon:
+    """
+    Logica del dispositivo di rilevazione presenze, indipendente dall'interfaccia grafica.
+
+    Gestisce una sessione alla volta (registrazione, lezione o esame): all'avvio crea in
+    background il foglio dell'operazione, ne recupera chiave e IV e carica gli studenti del
+    corso e le presenze già registrate; ogni scansione viene cifrata e accodata nell'outbox
+    del corso.
+    Le scansioni arrivano dal lettore RFID, se presente, oppure da start_session, scan e
+    register_student chiamati dall'interfaccia Tk o dall'API di controllo locale. L'esito
+    di ogni scansione viene conservato e può essere letto con recent_scans.
+    """
+
+    def __init__(self, sync_engine=None, reader=None, keychain=None):
+        self.sync_engine = sync_engine or SyncEngine()
+        self.sync_engine.track_record_counts()
+        self.keychain = keychain or create_keychain(self.sync_engine)
+        self.reader = reader
+        self.session = None
+        self.outboxes = {}
+        self.started_at = time.time()
+        self._lock = threading.RLock()
+        self._scans = deque(maxlen=SCAN_LOG_SIZE)
+        self._scan_seq = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._bootstrap_executor = ThreadPoolExecutor(max_workers=BOOTSTRAP_WORKERS, thread_name_prefix="bootstrap")
+
+    # Ciclo di vita
+
+    def start(self):
+        """Avvia la replica delle chiavi, il lettore RFID, se presente, e il thread che ne consuma le scansioni."""
+        self.keychain.start()
+        if self.reader is None or self._thread is not None:
+            return
+        self.reader.start()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._consume_reader, name="attendance-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Termina la sessione in corso e ferma il lettore e la replica delle chiavi."""
+        self.end_session()
+        self.keychain.stop()
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.reader.stop()
+
+    def _consume_reader(self):
+        while not self._stop_event.is_set():
+            try:
+                event = self.reader.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.scan(event.tag_id)
+            except Exception as e:
+                print(f"Errore durante la gestione del tag {event.tag_id}: {e}")
+
+    def get_outbox(self, database):
+        """
+        Restituisce l'outbox del database di un corso, avviandone i thread di invio alla prima richiesta.
+        Le outbox dei corsi già aperti restano attive, così che le code vengano svuotate anche cambiando corso.
+        """
+        with self._lock:
+            if database not in self.outboxes:
+                outbox = Outbox(database)
+                self.sync_engine.register_outbox_handlers(outbox)
+                outbox.start()
+                self.outboxes[database] = outbox
+            return self.outboxes[database]
+
+    # Sessioni
+
+    def start_session(self, operation_type, course_name, name=None, wait=False):
+        """
+        Avvia una sessione, terminando quella eventualmente in corso.
+
+        La sessione viene preparata in background (vedi _bootstrap): il metodo ritorna subito
+        e le scansioni ricevute nel frattempo vengono gestite appena la preparazione termina.
+
+        Args:
+            operation_type: "Registrazione", "Lezione" o "Esame".
+            course_name: Il nome del corso.
+            name: Nome della lezione o data dell'esame; ignorato per le registrazioni.
+            wait: Se True attende il termine della preparazione.
+
+        Returns:
+            Lo stato del daemon.
+        """
+        course_name = (course_name or "").strip()
+        name = "Registrazione" if operation_type == "Registrazione" else (name or "").strip()
+        if operation_type not in OPERATION_SHEET_TYPES:
+            raise DaemonError(f"operation must be one of {', '.join(OPERATION_SHEET_TYPES)}")
+        if not course_name:
+            raise DaemonError("course is required")
+        if not name:
+            raise DaemonError("name is required for lessons and exams")
+
+        session = AttendanceSession(operation_type, course_name, name)
+        session.outbox = self.get_outbox(session.database)
+        with self._lock:
+            self._end_session_locked()
+            self.session = session
+        print(f"Sessione avviata: {operation_type} {name} del corso {course_name}.")
+
+        threading.Thread(target=self._bootstrap, args=(session,), name="session-bootstrap", daemon=True).start()
+        if wait:
+            session.ready.wait()
+        return self.status()
+
+    def _bootstrap(self, session):
+        """
+        Prepara la sessione: foglio dell'operazione, chiave e IV, studenti e presenze già registrate.
+
+        La chiave viene letta dal portachiavi locale, che contatta Google Sheets solo alla prima
+        chiave mancante di un corso, e risolta prima del foglio, perché entrambi creerebbero la
+        cartella del corso se mancante; foglio e studenti vengono preparati in parallelo, insieme
+        al conteggio dei record già confermati sulla catena. Al termine vengono gestite le
+        scansioni in coda.
+        """
+        start = time.time()
+        roster = None
+        if session.operation_type != "Registrazione":
+            roster = self._bootstrap_executor.submit(self._load_roster, session)
+        counted = self._bootstrap_executor.submit(self.sync_engine.seed_record_count, session.operation_type,
+                                                  session.course_name, session.name)
+        try:
+            self._resolve_key(session)
+            sheet = self._bootstrap_executor.submit(self.sync_engine.create_sheet, OPERATION_SHEET_TYPES[session.operation_type],
+                                                    session.name, session.course_name)
+            if roster is not None:
+                roster.result()
+            try:
+                sheet.result()
+            except Exception as e:
+                # Le righe restano nell'outbox, che le invierà quando il foglio sarà disponibile
+                print(f"Errore durante la creazione del foglio {session.name}: {e}")
+        except Exception as e:
+            session.bootstrap_error = str(e)
+            print(f"Preparazione della sessione {session.name} fallita: {e}")
+        try:
+            counted.result()
+        except Exception as e:
+            # Senza il totale della catena il conteggio parte dai record confermati da questo processo
+            print(f"Errore durante la lettura dei record confermati di {session.name}: {e}")
+
+        with self._lock:
+            session.ready.set()
+            queued, session.queued_scans = session.queued_scans, []
+            if session.bootstrap_error is None:
+                print(f"Sessione {session.name} pronta in {time.time() - start:.1f}s, {len(queued)} scansioni in coda.")
+            for tag_id in queued:
+                if self.session is not session:
+                    # La sessione è stata sostituita o terminata durante la preparazione: l'esito
+                    # viene comunque registrato, così che il client sappia che la scansione è persa
+                    result = self._scan_result(SCAN_REJECTED, tag_id, session,
+                                               f"Sessione {session.name} terminata prima di essere pronta, scansione ignorata.")
+                else:
+                    result = self._scan_locked(session, tag_id)
+                print(result['message'])
+
+    def _resolve_key(self, session):
+        # Genera chiave e IV e controlla se già esistono delle vecchie chiavi
+        key, iv = generate_aes_key(), generate_aes_iv()
+        resultKey, resultIV = self.keychain.get_or_store(session.course_name, session.name, encode_bytes(key), encode_bytes(iv))
+        if resultKey and resultIV:
+            key, iv = decode_bytes(resultKey), decode_bytes(resultIV)
+            print("La chiave e l'IV già esistono nel wallet.")
+        else:
+            print("Nuova chiave e IV aggiunti al wallet del corso.")
+        session.key, session.iv = key, iv
+
+    def _load_roster(self, session):
+        session.roster = StudentRoster(session.database)
+        loaded = session.roster.load()
+        session.attendance = SessionAttendance(session.database, session.operation_type, session.name)
+        print(f"Caricati {loaded} studenti, {len(session.attendance)} già registrati in {session.name}.")
+
+    def _end_session_locked(self):
+        if self.session is not None:
+            # Invia subito le righe e i record ancora in attesa di completare un gruppo
+            self.session.outbox.flush()
+            print(f"Sessione terminata: {self.session.operation_type} {self.session.name}.")
+            self.session = None
+
+    def end_session(self):
+        """Termina la sessione in corso, se presente."""
+        with self._lock:
+            self._end_session_locked()
+        return self.status()
+
+    # Scansioni
+
+    def register_student(self, nome, cognome, matricola, tag_id=None):
+        """
+        Registra uno studente durante una sessione di registrazione.
+
+        Se tag_id è None lo studente viene associato alla prossima scansione.
+
+        Returns:
+            L'esito della scansione, oppure lo stato del daemon se lo studente attende il tag.
+        """
+        nome, cognome, matricola = (str(value or "").strip() for value in (nome, cognome, matricola))
+        if not (nome and cognome and matricola):
+            raise DaemonError("first name, last name and matricola are required")
+        with self._lock:
+            if self.session is None or self.session.operation_type != "Registrazione":
+                raise DaemonError("no registration session in progress")
+            self.session.pending_student = (nome, cognome, matricola)
+        if tag_id is None:
+            return self.status()
+        return self.scan(tag_id)
+
+    def scan(self, tag_id):
+        """
+        Gestisce la scansione di un tag nella sessione in corso.
+
+        Returns:
+            Dizionario con l'esito ('accepted', 'duplicate', 'unknown', 'rejected' o 'queued') e i dati dello studente.
+            Le scansioni 'queued' non compaiono in recent_scans finché non vengono gestite.
+        """
+        tag_id = str(tag_id).strip()
+        if not tag_id:
+            raise DaemonError("tag_id is required")
+        print(f"Tag letto: {tag_id}")
+        with self._lock:
+            session = self.session
+            if session is not None and not session.ready.is_set():
+                session.queued_scans.append(tag_id)
+                result = {'seq': None, 'status': SCAN_QUEUED, 'tag_id': tag_id, 'operation': session.operation_type,
+                          'student': None, 'message': "Sessione in preparazione, scansione in coda.", 'at': time.time()}
+            else:
+                result = self._scan_locked(session, tag_id)
+        print(result['message'])
+        return result
+
+    def _scan_locked(self, session, tag_id):
+        if session is None:
+            return self._scan_result(SCAN_REJECTED, tag_id, None, "Nessuna sessione in corso.")
+        if session.bootstrap_error is not None:
+            return self._scan_result(SCAN_REJECTED, tag_id, session, f"Sessione non disponibile: {session.bootstrap_error}")
+        if session.operation_type == "Registrazione":
+            return self._scan_registration(session, tag_id)
+        return self._scan_attendance(session, tag_id)
+
+    def _scan_registration(self, session, tag_id):
+        if session.pending_student is None:
+            return self._scan_result(SCAN_REJECTED, tag_id, session, "Nessuno studente in attesa di registrazione.")
+        nome, cognome, matricola = session.pending_student
+        session.pending_student = None
+        # Lo studente viene inserito nel db nella stessa transazione che accoda l'aggiornamento del file
+        # di registrazione e il salvataggio su blockchain di tipo_operazione, nome_corso, id_cifrato
+        items = self._sync_items(session, ["'" + tag_id, nome, cognome, "'" + matricola], " ", tag_id)
+        with course_pool.connection(session.database) as conn:
+            inserted = insert_students(conn, [(tag_id, nome, cognome, matricola)],
+                                       lambda conn, students: session.outbox.enqueue_in(conn, items))
+        if not inserted:
+            return self._scan_result(SCAN_DUPLICATE, tag_id, session, "Studente già presente nel db.")
+        self._sync_enqueued(session)
+        return self._scan_result(SCAN_ACCEPTED, tag_id, session, "Studente inserito con successo.", [nome, cognome, matricola])
+
+    def _scan_attendance(self, session, tag_id):
+        # Solo gli studenti registrati al corso vengono segnati come presenti nella sessione
+        info_studente = session.roster.get(tag_id)
+        if not info_studente:
+            return self._scan_result(SCAN_UNKNOWN, tag_id, session, "Studente non trovato.")
+        if session.operation_type == "Lezione":
+            ultima_colonna = "'" + datetime.now().strftime("%H:%M:%S")
+        else:
+            ultima_colonna = " "  # Voto dell'esame, inserito in seguito dal docente
+        items = self._sync_items(session, ["'" + tag_id, info_studente[0], info_studente[1], "'" + str(info_studente[2]), ultima_colonna],
+                                 session.name, tag_id)
+        # Presenza e sincronizzazioni vengono salvate nella stessa transazione: dopo un riavvio
+        # uno studente già segnato ha sempre le sue righe nell'outbox
+        if not session.attendance.mark(tag_id, lambda conn: session.outbox.enqueue_in(conn, items)):
+            return self._scan_result(SCAN_DUPLICATE, tag_id, session, f"Studente gia' registrato in {session.name}.", info_studente)
+        self._sync_enqueued(session)
+        return self._scan_result(SCAN_ACCEPTED, tag_id, session, "Presenza registrata.", info_studente)
+
+    def _sync_items(self, session, data, additional_info, tag_id):
+        """Restituisce gli elementi dell'outbox di una scansione: la riga per Google Sheets e il record cifrato per la blockchain."""
+        id_cifrato = encrypt_id_aes(tag_id.encode(), session.iv, session.key)
+        return [
+            (TARGET_SHEETS, {
+                'file_name': session.name,
+                'folder_name': session.course_name,
+                'data': data
+            }),
+            (TARGET_BLOCKCHAIN, {
+                'operation_type': session.operation_type,
+                'course_name': session.course_name,
+                'additional_info': additional_info,
+                'encrypted_id': encode_bytes(id_cifrato)
+            })
+        ]
+
+    def _sync_enqueued(self, session):
+        session.outbox.wake([TARGET_SHEETS, TARGET_BLOCKCHAIN])
+        session.accepted += 1
+
+    def _scan_result(self, status, tag_id, session, message, student=None):
+        self._scan_seq += 1
+        result = {
+            'seq': self._scan_seq,
+            'status': status,
+            'tag_id': tag_id,
+            'operation': session.operation_type if session else None,
+            'student': student,
+            'message': message,
+            'at': time.time()
+        }
+        self._scans.append(result)
+        return result
+
+    def recent_scans(self, since=0):
+        """Restituisce gli esiti delle scansioni con numero di sequenza maggiore di 'since'."""
+        with self._lock:
+            return [result for result in self._scans if result['seq'] > since]
+
+    def status(self):
+        """Restituisce lo stato della sessione in corso, del lettore e delle outbox."""
+        with self._lock:
+            session = self.session.to_dict() if self.session is not None else None
+            if session is not None:
+                # Record della sessione già confermati sulla blockchain, dalle ricevute delle transazioni
+                session['confirmed'] = self.sync_engine.confirmed_count(
+                    self.session.operation_type, self.session.course_name, self.session.name)
+            return {
+                'session': session,
+                'reader': self._thread is not None,
+                'last_scan_seq': self._scan_seq,
+                'uptime': time.time() - self.started_at,
+                'outboxes': {database: outbox.queue_depth() for database, outbox in self.outboxes.items()}
+            }
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """
+    API di controllo del daemon, in JSON:
+
+        GET  /status                 stato del daemon
+        GET  /scans?since=N          esiti delle scansioni successive alla N-esima
+        POST /session/start          {"operation", "course", "name", "wait" (facoltativo)}
+        POST /session/stop
+        POST /scan                   {"tag_id"}
+        POST /students               {"first_name", "last_name", "matricola", "tag_id" (facoltativo)}
+    """
+
+    daemon = None
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise DaemonError("request body must be a JSON object")
+        return body
+
+    def _dispatch(self, handler):
+        try:
+            self._send_json(200, handler())
+        except (DaemonError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            print(f"Errore dell'API di controllo: {e}")
+            self._send_json(500, {'error': str(e)})
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/status':
+            self._dispatch(self.daemon.status)
+        elif path == '/scans':
+            params = dict(part.split('=', 1) for part in query.split('&') if '=' in part)
+            self._dispatch(lambda: {'scans': self.daemon.recent_scans(int(params.get('since', 0)))})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        routes = {
+            '/session/start': lambda body: self.daemon.start_session(body.get('operation'), body.get('course'), body.get('name'),
+                                                                  bool(body.get('wait'))),
+            '/session/stop': lambda body: self.daemon.end_session(),
+            '/scan': lambda body: self.daemon.scan(body.get('tag_id', "")),
+            '/students': lambda body: self.daemon.register_student(body.get('first_name'), body.get('last_name'),
+                                                                   body.get('matricola'), body.get('tag_id')),
+        }
+        route = routes.get(self.path)
+        if route is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+        self._dispatch(lambda: route(self._read_json()))
+
+    def log_message(self, format, *args):
+        # Le richieste non vengono stampate: l'interfaccia interroga /scans più volte al secondo
+        pass
+
+
+def start_control_server(daemon, host=DAEMON_HOST, port=DAEMON_PORT):
+    """Avvia l'API di controllo in un thread in background e restituisce il server."""
+    handler = type('BoundControlRequestHandler', (ControlRequestHandler,), {'daemon': daemon})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="attendance-control", daemon=True).start()
+    print(f"API di controllo in ascolto su http://{host}:{port}")
+    return server
+
+
+def create_reader():
+    """Crea il servizio del lettore RFID; il modulo viene importato solo sui dispositivi che lo usano."""
+    from rfidReader import RFIDReaderService
+    return RFIDReaderService()
+
+
+if __name__ == "__main__":
+    # Esegue il dispositivo senza interfaccia grafica
+    args = sys.argv[1:]
+    no_reader = "--no-reader" in args
+    args = [arg for arg in args if arg != "--no-reader"]
+    if len(args) > 1 or (args and not args[0].isdigit()):
+        print("Uso: python attendanceDaemon.py [porta] [--no-reader]")
+        sys.exit(1)
+    port = int(args[0]) if args else DAEMON_PORT
+    reader = None if no_reader else create_reader()
+
+    daemon = AttendanceDaemon(reader=reader)
+    daemon.start()
+    server = start_control_server(daemon, port=port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("Arresto del daemon.")
+    finally:
+        server.shutdown()
+        daemon.stop()
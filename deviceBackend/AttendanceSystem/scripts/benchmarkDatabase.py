@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+from courseDatabase import CourseDatabasePool, insert_students
+
+
+def genera_studenti(numero):
+    """Genera studenti fittizi con tag ID e matricole univoci."""
+    tag_ids = random.sample(range(10**11, 10**12), numero)
+    return [(str(tag_id), f"Nome{i}", f"Cognome{i}", f"{i:06d}") for i, tag_id in enumerate(tag_ids)]
+
+
+def benchmark_legacy(database, studenti, ricerche):
+    """Comportamento precedente: una connessione per operazione, nessun indice, un commit per riga."""
+    conn = sqlite3.connect(database)
+    conn.execute("CREATE TABLE studenti (id TEXT PRIMARY KEY, nome TEXT NOT NULL, cognome TEXT NOT NULL, matricola TEXT NOT NULL)")
+    conn.close()
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(database)
+    for studente in studenti:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM studenti WHERE matricola = ?", (studente[3],))
+        if not cursor.fetchone():
+            cursor.execute("INSERT INTO studenti (id, nome, cognome, matricola) VALUES (?, ?, ?, ?)", studente)
+            conn.commit()
+    conn.close()
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for matricola in ricerche:
+        # Ogni click su un pulsante apriva una nuova connessione
+        conn = sqlite3.connect(database)
+        conn.execute("SELECT nome, cognome, matricola FROM studenti WHERE matricola = ?", (matricola,)).fetchone()
+        conn.close()
+    lookup_time = time.perf_counter() - start
+    return insert_time, lookup_time
+
+
+def benchmark_pool(database, studenti, ricerche):
+    """Pool di connessioni in WAL, indice sulla matricola e inserimento in un'unica transazione."""
+    pool = CourseDatabasePool()
+
+    start = time.perf_counter()
+    with pool.connection(database) as conn:
+        insert_students(conn, studenti)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for matricola in ricerche:
+        with pool.connection(database) as conn:
+            conn.execute("SELECT nome, cognome, matricola FROM studenti WHERE matricola = ?", (matricola,)).fetchone()
+    lookup_time = time.perf_counter() - start
+    pool.close_all()
+    return insert_time, lookup_time
+
+
+if __name__ == "__main__":
+    # Confronta inserimenti e ricerche sul database di un corso con e senza il pool
+    numero = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    studenti = genera_studenti(numero)
+    ricerche = [random.choice(studenti)[3] for _ in range(numero)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy = benchmark_legacy(os.path.join(directory, "legacy.db"), studenti, ricerche)
+        pooled = benchmark_pool(os.path.join(directory, "pool.db"), studenti, ricerche)
+
+    print(f"{numero} studenti, {len(ricerche)} ricerche per matricola")
+    print(f"{'':12}{'inserimenti/s':>16}{'ricerche/s':>16}")
+    for nome, (insert_time, lookup_time) in (("precedente", legacy), ("pool", pooled)):
+        print(f"{nome:12}{numero / insert_time:16.0f}{len(ricerche) / lookup_time:16.0f}")
+    print(f"Miglioramento: inserimenti x{legacy[0] / pooled[0]:.1f}, ricerche x{legacy[1] / pooled[1]:.1f}")
@@ -0,0 +1,149 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Numero massimo di connessioni inattive tenute aperte per ogni database di corso
+POOL_MAX_IDLE = 4
+# Secondi di attesa quando il database è bloccato da un'altra connessione
+BUSY_TIMEOUT = 30
+
+# Impostazioni applicate a ogni nuova connessione. In modalità WAL le letture non
+# bloccano le scritture (l'interfaccia e i thread dell'outbox lavorano sullo stesso file)
+# e synchronous=NORMAL evita un fsync a ogni commit senza rischiare di corrompere il database.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-4096",
+)
+
+
+def apply_pragmas(conn):
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+
+def create_student_schema(conn):
+    """Crea la tabella degli studenti e l'indice sulla matricola se non esistono."""
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS studenti (
+                id TEXT PRIMARY KEY,
+                nome TEXT NOT NULL,
+                cognome TEXT NOT NULL,
+                matricola TEXT NOT NULL
+            )
+        """)
+    try:
+        with conn:
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_studenti_matricola ON studenti (matricola)")
+    except sqlite3.IntegrityError:
+        # Database creato prima dell'indice con matricole duplicate: l'indice resta non univoco
+        print("Matricole duplicate nella tabella studenti, indice non univoco.")
+        with conn:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_studenti_matricola_dup ON studenti (matricola)")
+
+
+class CourseDatabasePool:
+    """
+    Pool di connessioni ai database SQLite dei corsi.
+
+    Ogni database ha la sua coda di connessioni inattive, già configurate con le PRAGMAS:
+    una connessione viene aperta solo se nessuna è disponibile e, quando viene restituita,
+    resta aperta per la richiesta successiva. Lo schema della tabella 'studenti' viene
+    creato una sola volta per database, alla prima connessione.
+    """
+
+    def __init__(self, max_idle=POOL_MAX_IDLE, timeout=BUSY_TIMEOUT):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}
+        self._initialized = set()
+        self._lock = threading.Lock()
+
+    def _open(self, database):
+        # La connessione può passare da un thread all'altro, ma è usata da uno solo alla volta
+        conn = sqlite3.connect(database, timeout=self.timeout, check_same_thread=False)
+        apply_pragmas(conn)
+        return conn
+
+    def _idle_queue(self, database):
+        with self._lock:
+            if database not in self._idle:
+                self._idle[database] = queue.LifoQueue(maxsize=self.max_idle)
+            return self._idle[database]
+
+    def acquire(self, database):
+        """Restituisce una connessione al database indicato, dal pool se disponibile."""
+        try:
+            conn = self._idle_queue(database).get_nowait()
+        except queue.Empty:
+            conn = self._open(database)
+        with self._lock:
+            first_use = database not in self._initialized
+            self._initialized.add(database)
+        if first_use:
+            create_student_schema(conn)
+        return conn
+
+    def release(self, database, conn):
+        """Rimette la connessione nel pool, annullando un'eventuale transazione lasciata aperta."""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle_queue(database).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self, database):
+        """Context manager che prende una connessione dal pool e la restituisce all'uscita."""
+        conn = self.acquire(database)
+        try:
+            yield conn
+        finally:
+            self.release(database, conn)
+
+    def close_all(self):
+        """Chiude tutte le connessioni inattive."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for pool in idle.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+course_pool = CourseDatabasePool()
+
+
+def insert_students(conn, students, on_inserted=None):
+    """
+    Inserisce più studenti in un'unica transazione, saltando quelli con ID o matricola già presenti.
+
+    Args:
+        conn: Connessione al database del corso.
+        students: Lista di tuple (id, nome, cognome, matricola).
+        on_inserted: Funzione opzionale che riceve la connessione e gli studenti inseriti ed è
+            eseguita nella stessa transazione (es. per accodare le sincronizzazioni nell'outbox):
+            se fallisce nessuno studente viene inserito.
+
+    Returns:
+        La lista degli studenti effettivamente inseriti.
+    """
+    inserted = []
+    with conn:
+        for student in students:
+            id, nome, cognome, matricola = (str(value) for value in student)
+            if conn.execute("SELECT 1 FROM studenti WHERE matricola = ?", (matricola,)).fetchone():
+                continue
+            cursor = conn.execute("INSERT OR IGNORE INTO studenti (id, nome, cognome, matricola) VALUES (?, ?, ?, ?)",
+                                  (id, nome, cognome, matricola))
+            if cursor.rowcount:
+                inserted.append((id, nome, cognome, matricola))
+        if inserted and on_inserted is not None:
+            on_inserted(conn, inserted)
+    return inserted
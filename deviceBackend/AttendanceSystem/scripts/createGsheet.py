@@ -4,11 +4,19 @@ import pickle
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from driveCache import drive_cache, retry_on_not_found
 
 # Definizione degli ambiti di accesso per i servizi Google
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 CREDENTIALS_FILE = '/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/credentials.json'
 
+# Intestazioni dei fogli in base al tipo
+SHEET_HEADERS = {
+    "R": [["Tag_ID", "Nome", "Cognome", "Matricola"]],
+    "L": [["Tag_ID", "Nome", "Cognome", "Matricola", "Orario di arrivo"]],
+    "E": [["Tag_ID", "Nome", "Cognome", "Matricola", "Voto"]]
+}
+
 def authenticate_google_services():
     """
     Autentica l'utente con i servizi di Google Drive e Google Sheets.
@@ -52,6 +60,11 @@ def find_or_create_folder(drive_service, folder_name, parent_id=None):
     Returns:
         folder_id: L'ID della cartella trovata o creata.
     """
+    # Controlla prima la cache locale degli ID
+    folder_id = drive_cache.get('folder', folder_name, parent_id)
+    if folder_id:
+        return folder_id
+
     # Query per trovare la cartella con il nome specificato
     query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}'"
     if parent_id:
@@ -65,9 +78,11 @@ def find_or_create_folder(drive_service, folder_name, parent_id=None):
         if parent_id:
             file_metadata['parents'] = [parent_id]
         folder = drive_service.files().create(body=file_metadata, fields='id').execute()
-        return folder.get('id')
+        folder_id = folder.get('id')
     else:
-        return folders[0].get('id')
+        folder_id = folders[0].get('id')
+    drive_cache.set(folder_id, 'folder', folder_name, parent_id)
+    return folder_id
 
 def find_file_by_name(drive_service, file_name, folder_id):
     """
@@ -81,12 +96,22 @@ def find_file_by_name(drive_service, file_name, folder_id):
     Returns:
         file_id: L'ID del file trovato o None se non esiste.
     """
+    # Controlla prima la cache locale degli ID
+    file_id = drive_cache.get('sheet', folder_id, file_name)
+    if file_id:
+        return file_id
+
     # Query per trovare il file con il nome specificato e all'interno della cartella specificata
     query = f"mimeType='application/vnd.google-apps.spreadsheet' and name='{file_name}' and '{folder_id}' in parents"
     response = drive_service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
     files = response.get('files', [])
-    return files[0].get('id') if files else None
+    if not files:
+        return None
+    file_id = files[0].get('id')
+    drive_cache.set(file_id, 'sheet', folder_id, file_name)
+    return file_id
 
+@retry_on_not_found
 def create_sheet(drive_service, sheets_service, sheet_type, file_name, folder_name):
     """
     Crea un nuovo foglio di calcolo su Google Sheets in una cartella specificata.
@@ -123,12 +148,7 @@ def create_sheet(drive_service, sheets_service, sheet_type, file_name, folder_na
     sheet_id = spreadsheet['spreadsheetId']
     
     # Imposta le intestazioni per il foglio in base al tipo
-    headers_map = {
-        "R": [["Tag_ID", "Nome", "Cognome", "Matricola"]],
-        "L": [["Tag_ID", "Nome", "Cognome", "Matricola", "Orario di arrivo"]],
-        "E": [["Tag_ID", "Nome", "Cognome", "Matricola", "Voto"]]
-    }
-    headers = headers_map.get(sheet_type, [])
+    headers = SHEET_HEADERS.get(sheet_type, [])
     if headers:
         resource = {"values": headers}
         sheets_service.spreadsheets().values().update(
@@ -136,6 +156,7 @@ def create_sheet(drive_service, sheets_service, sheet_type, file_name, folder_na
 
     # Sposta il nuovo foglio nella cartella specificata
     drive_service.files().update(fileId=sheet_id, addParents=folder_id, removeParents='root', fields='id, parents').execute()
+    drive_cache.set(sheet_id, 'sheet', folder_id, file_name)
 
     print(f"Foglio creato con successo. ID: {sheet_id}")
     print(f"URL: {spreadsheet['spreadsheetUrl']}")
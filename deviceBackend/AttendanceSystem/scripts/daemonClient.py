@@ -0,0 +1,51 @@
+import json
+import urllib.error
+import urllib.request
+
+from attendanceDaemon import DaemonError, DAEMON_HOST, DAEMON_PORT
+
+
+class DaemonClient:
+    """
+    Client dell'API di controllo di attendanceDaemon.py.
+
+    Espone gli stessi metodi di AttendanceDaemon, così che l'interfaccia Tk possa usare
+    indifferentemente un daemon nello stesso processo o uno già in esecuzione.
+    """
+
+    def __init__(self, url=f"http://{DAEMON_HOST}:{DAEMON_PORT}", timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(f"{self.url}{path}", data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', str(e))
+            except ValueError:
+                message = str(e)
+            raise DaemonError(message)
+
+    def status(self):
+        return self._request('GET', '/status')
+
+    def recent_scans(self, since=0):
+        return self._request('GET', f'/scans?since={int(since)}')['scans']
+
+    def start_session(self, operation_type, course_name, name=None, wait=False):
+        return self._request('POST', '/session/start', {'operation': operation_type, 'course': course_name, 'name': name, 'wait': wait})
+
+    def end_session(self):
+        return self._request('POST', '/session/stop', {})
+
+    def scan(self, tag_id):
+        return self._request('POST', '/scan', {'tag_id': str(tag_id)})
+
+    def register_student(self, nome, cognome, matricola, tag_id=None):
+        return self._request('POST', '/students', {'first_name': nome, 'last_name': cognome,
+                                                   'matricola': matricola, 'tag_id': tag_id})
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import threading
+import functools
+
+# File e durata della cache degli ID di Google Drive
+DRIVE_CACHE_FILE = 'drive_cache.json'
+DRIVE_CACHE_TTL = 24 * 3600
+
+
+class DriveIdCache:
+    """
+    Cache persistente degli ID di cartelle e fogli di calcolo su Google Drive.
+
+    Associa chiavi come ('sheet', cartella del corso, nome del foglio) all'ID trovato su
+    Drive, così che risolvere un foglio già noto non richieda chiamate di rete. Le voci
+    scadono dopo 'ttl' secondi, tranne quelle salvate come permanenti (es. da provisionTerm.py
+    per un intero semestre), e vengono salvate su file, accanto a token.pickle. Anche le voci
+    permanenti vengono rimosse se Drive risponde 404 (vedi retry_on_not_found).
+    """
+
+    def __init__(self, path=DRIVE_CACHE_FILE, ttl=DRIVE_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Cache degli ID di Drive non leggibile, verrà ricreata: {e}")
+            return {}
+
+    def _save(self):
+        # Scrittura atomica per non lasciare un file a metà se il processo viene interrotto
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self._entries, file)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(parts):
+        return "|".join(str(part) if part is not None else "" for part in parts)
+
+    def get(self, *parts):
+        """Restituisce l'ID associato alla chiave, o None se assente o scaduto."""
+        with self._lock:
+            entry = self._entries.get(self._key(parts))
+            if entry is None or (not entry.get('permanent') and time.time() - entry['saved_at'] > self.ttl):
+                return None
+            return entry['id']
+
+    def set(self, file_id, *parts, permanent=False):
+        """Associa un ID alla chiave indicata; se permanent è True la voce non scade."""
+        with self._lock:
+            self._entries[self._key(parts)] = {'id': file_id, 'saved_at': time.time(), 'permanent': permanent}
+            self._save()
+
+    def invalidate(self, *parts):
+        """Rimuove la voce associata alla chiave indicata."""
+        with self._lock:
+            if self._entries.pop(self._key(parts), None) is not None:
+                self._save()
+
+    def invalidate_ids(self, text):
+        """
+        Rimuove tutte le voci il cui ID compare nel testo indicato (es. l'URI di una richiesta fallita).
+
+        Returns:
+            Il numero di voci rimosse.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry['id'] in text]
+            for key in keys:
+                del self._entries[key]
+            if keys:
+                self._save()
+            return len(keys)
+
+
+drive_cache = DriveIdCache()
+
+
+def is_not_found(error):
+    """Indica se l'errore è un 404 restituito dalle API di Google."""
+    resp = getattr(error, 'resp', None)
+    return resp is not None and getattr(resp, 'status', None) == 404
+
+
+def retry_on_not_found(function):
+    """
+    Riesegue una volta la funzione se le API di Google rispondono 404, dopo aver
+    invalidato gli ID della cache coinvolti nella richiesta fallita.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+            removed = drive_cache.invalidate_ids(str(getattr(e, 'uri', '')))
+            print(f"Risorsa di Drive non trovata, {removed} ID rimossi dalla cache. Nuovo tentativo.")
+            return function(*args, **kwargs)
+    return wrapper
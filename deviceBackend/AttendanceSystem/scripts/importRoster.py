@@ -0,0 +1,131 @@
+import sys
+import csv
+
+from syncEngine import SyncEngine
+from keyChain import create_keychain
+from recordCodec import encode_bytes, decode_bytes
+from aesCipher import generate_aes_key, generate_aes_iv, encrypt_id_aes
+from courseDatabase import course_pool, insert_students
+from outbox import Outbox, TARGET_SHEETS, TARGET_BLOCKCHAIN, STATUS_IN_PROGRESS
+
+# Intestazioni accettate come prima riga del file CSV
+HEADER_NAMES = {'id', 'tag', 'tag_id', 'tag id'}
+
+
+def read_roster_csv(path):
+    """
+    Legge un file CSV con le colonne (tag ID, nome, cognome, matricola).
+    La prima riga viene ignorata se è un'intestazione.
+
+    Returns:
+        La lista delle tuple (tag ID, nome, cognome, matricola) valide.
+    """
+    students = []
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        for line_number, row in enumerate(csv.reader(file), 1):
+            row = [value.strip() for value in row]
+            if not any(row):
+                continue
+            if line_number == 1 and row[0].lower() in HEADER_NAMES:
+                continue
+            if len(row) != 4 or not all(row):
+                print(f"Riga {line_number} ignorata, servono 4 valori non vuoti: {row}")
+                continue
+            students.append(tuple(row))
+    return students
+
+
+def registration_key(keychain, course_name):
+    """Restituisce chiave e IV delle registrazioni del corso, creandoli se non esistono."""
+    key, iv = generate_aes_key(), generate_aes_iv()
+    resultKey, resultIV = keychain.get_or_store(course_name, "Registrazione", encode_bytes(key), encode_bytes(iv))
+    if resultKey and resultIV:
+        return decode_bytes(resultKey), decode_bytes(resultIV)
+    return key, iv
+
+
+def import_roster(course_name, students, sync_engine=None):
+    """
+    Registra in blocco gli studenti di un corso.
+
+    Gli studenti vengono scritti nella tabella 'studenti' nella stessa transazione che accoda
+    nell'outbox del corso le righe del foglio Registrazione e le registrazioni cifrate, così
+    che nessuno studente resti nel db senza le sue sincronizzazioni. Gli elementi vengono poi
+    inviati direttamente, le righe con un'unica richiesta e i record con transazioni addRecords;
+    quelli il cui invio fallisce restano nell'outbox e vengono inviati dall'interfaccia.
+
+    Args:
+        course_name: Il nome del corso.
+        students: Lista di tuple (tag ID, nome, cognome, matricola).
+        sync_engine: Il motore di sincronizzazione da usare; se None ne viene creato uno.
+
+    Returns:
+        Il numero di studenti registrati.
+    """
+    database = f"{course_name}.db"
+    sync_engine = sync_engine or SyncEngine()
+    keychain = create_keychain(sync_engine)
+    key, iv = registration_key(keychain, course_name)
+    # Una chiave nuova viene replicata subito su Google Sheets; se non riesce resta nel portachiavi locale
+    keychain.sync_pending()
+
+    outbox = Outbox(database)
+    queued = {}
+
+    def enqueue_sync(conn, inserted):
+        # Gli elementi restano 'in_progress' finché questo processo prova a inviarli direttamente
+        rows = [["'" + tag_id, nome, cognome, "'" + matricola] for tag_id, nome, cognome, matricola in inserted]
+        records = [("Registrazione", course_name, " ", encode_bytes(encrypt_id_aes(tag_id.encode(), iv, key)))
+                   for tag_id, _, _, _ in inserted]
+        queued[TARGET_SHEETS] = (rows, outbox.enqueue_in(conn, [
+            (TARGET_SHEETS, {'file_name': "Registrazione", 'folder_name': course_name, 'data': row}) for row in rows
+        ], STATUS_IN_PROGRESS))
+        queued[TARGET_BLOCKCHAIN] = (records, outbox.enqueue_in(conn, [(TARGET_BLOCKCHAIN, {
+            'operation_type': operation_type,
+            'course_name': course,
+            'additional_info': additional_info,
+            'encrypted_id': encrypted_id
+        }) for operation_type, course, additional_info, encrypted_id in records], STATUS_IN_PROGRESS))
+
+    with course_pool.connection(database) as conn:
+        inserted = insert_students(conn, students, enqueue_sync)
+    print(f"{len(inserted)} studenti inseriti nel db, {len(students) - len(inserted)} già presenti.")
+    if not inserted:
+        return 0
+
+    rows, row_ids = queued[TARGET_SHEETS]
+    try:
+        sync_engine.create_sheet("R", "Registrazione", course_name)
+        if sync_engine.append_rows("Registrazione", course_name, rows) is False:
+            raise RuntimeError("foglio Registrazione non trovato")
+        outbox.complete(row_ids)
+    except Exception as e:
+        print(f"Errore durante l'aggiornamento del foglio Registrazione, righe lasciate nell'outbox: {e}")
+        outbox.release(row_ids, str(e))
+
+    # Tutte le transazioni vengono inviate senza attendere le conferme: restano in coda solo i record di quelle fallite
+    records, record_ids = queued[TARGET_BLOCKCHAIN]
+    start = 0
+    for count, future in sync_engine.submit_records(records):
+        batch_ids = record_ids[start:start + count]
+        start += count
+        try:
+            future.result()
+            outbox.complete(batch_ids)
+        except Exception as e:
+            print(f"Errore durante l'invio delle registrazioni, record lasciati nell'outbox: {e}")
+            outbox.release(batch_ids, str(e))
+
+    return len(inserted)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python importRoster.py <nome_corso> <file_csv>")
+        sys.exit(1)
+
+    course_name, path = sys.argv[1], sys.argv[2]
+    students = read_roster_csv(path)
+    print(f"{len(students)} studenti letti da {path}.")
+    imported = import_roster(course_name, students)
+    print(f"{imported} studenti registrati nel corso {course_name}.")
@@ -0,0 +1,306 @@
+import os
+import sqlite3
+import threading
+import time
+
+from abc import ABC, abstractmethod
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from recordCodec import encode_bytes, decode_bytes
+from courseDatabase import apply_pragmas
+
+# Database locale delle chiavi dei corsi e file con la chiave che le cifra
+KEYCHAIN_DATABASE = 'keychain.db'
+KEYCHAIN_MASTER_KEY_FILE = 'keychain.key'
+# Secondi tra due tentativi di invio a Google Sheets delle chiavi non ancora replicate
+KEYCHAIN_SYNC_INTERVAL = 30
+# Byte del nonce di AES-GCM con cui sono cifrate le voci del database locale
+NONCE_SIZE = 12
+
+
+class KeyChain(ABC):
+    """
+    Interfaccia dei portachiavi dei corsi.
+
+    Un portachiavi associa a ogni coppia (corso, operazione) una chiave e un IV, salvati
+    come stringhe nel formato di recordCodec. L'operazione è 'Registrazione', il nome
+    della lezione o la data dell'esame, come nel foglio ChiaviCorso.
+    """
+
+    @abstractmethod
+    def get(self, course_name, operation_name):
+        """Restituisce (chiave, IV) dell'operazione, o (None, None) se non esistono."""
+
+    @abstractmethod
+    def load_course(self, course_name):
+        """Restituisce tutte le chiavi di un corso: {operazione: (chiave, IV)}."""
+
+    @abstractmethod
+    def store_keys(self, course_name, keys):
+        """
+        Salva le chiavi indicate ({operazione: (chiave, IV)}) delle operazioni che non ne hanno ancora una.
+
+        Returns:
+            Tutte le chiavi del corso dopo il salvataggio; per le operazioni che avevano già
+            una chiave viene restituita quella esistente.
+        """
+
+    def get_or_store(self, course_name, operation_name, key, iv):
+        """
+        Restituisce la chiave e l'IV già salvati per un'operazione, oppure salva quelli forniti.
+
+        Returns:
+            Tuple contenente (key, IV) esistenti se trovati, altrimenti (None, None) dopo aver salvato i nuovi dati.
+        """
+        existing_key, existing_iv = self.get(course_name, operation_name)
+        if existing_key is not None:
+            return existing_key, existing_iv
+        stored = self.store_keys(course_name, {operation_name: (key, iv)})[operation_name]
+        return (None, None) if stored == (key, iv) else stored
+
+
+class LocalKeyChain(KeyChain):
+    """
+    Portachiavi locale in un database SQLite, con chiave primaria (corso, operazione).
+
+    Chiavi e IV vengono cifrati con AES-GCM usando una chiave del dispositivo salvata in un
+    file leggibile solo dal proprietario. Ogni voce ricorda se è già stata replicata su Google Sheets.
+    """
+
+    def __init__(self, database=KEYCHAIN_DATABASE, master_key_file=KEYCHAIN_MASTER_KEY_FILE):
+        self.database = database
+        self._aead = AESGCM(self._load_master_key(master_key_file))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database, timeout=30, check_same_thread=False)
+        apply_pragmas(self._conn)
+        self.create_table()
+
+    @staticmethod
+    def _load_master_key(path):
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                return file.read()
+        key = AESGCM.generate_key(bit_length=256)
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as file:
+            file.write(key)
+        return key
+
+    def create_table(self):
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chiavi (
+                    corso TEXT NOT NULL,
+                    operazione TEXT NOT NULL,
+                    chiave TEXT NOT NULL,
+                    iv TEXT NOT NULL,
+                    replicata INTEGER NOT NULL DEFAULT 0,
+                    creata_il REAL NOT NULL,
+                    PRIMARY KEY (corso, operazione)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chiavi_replicata ON chiavi (replicata)")
+
+    def _seal(self, course_name, operation_name, value):
+        # Corso e operazione sono dati associati: una voce copiata su un'altra riga non si decifra
+        nonce = os.urandom(NONCE_SIZE)
+        associated_data = f"{course_name}|{operation_name}".encode('utf-8')
+        return encode_bytes(nonce + self._aead.encrypt(nonce, value.encode('utf-8'), associated_data))
+
+    def _open(self, course_name, operation_name, value):
+        data = decode_bytes(value)
+        associated_data = f"{course_name}|{operation_name}".encode('utf-8')
+        return self._aead.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], associated_data).decode('utf-8')
+
+    def get(self, course_name, operation_name):
+        with self._lock:
+            row = self._conn.execute("SELECT chiave, iv FROM chiavi WHERE corso = ? AND operazione = ?",
+                                     (course_name, operation_name)).fetchone()
+        if row is None:
+            return None, None
+        return self._open(course_name, operation_name, row[0]), self._open(course_name, operation_name, row[1])
+
+    def load_course(self, course_name):
+        with self._lock:
+            rows = self._conn.execute("SELECT operazione, chiave, iv FROM chiavi WHERE corso = ?", (course_name,)).fetchall()
+        return {operation: (self._open(course_name, operation, key), self._open(course_name, operation, iv))
+                for operation, key, iv in rows}
+
+    def store_keys(self, course_name, keys):
+        """Salva, come non ancora replicate, le chiavi delle operazioni che non ne hanno ancora una."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chiavi (corso, operazione, chiave, iv, replicata, creata_il) VALUES (?, ?, ?, ?, 0, ?)",
+                [(course_name, operation, self._seal(course_name, operation, key), self._seal(course_name, operation, iv), now)
+                 for operation, (key, iv) in keys.items()])
+        return self.load_course(course_name)
+
+    def apply_remote(self, course_name, keys):
+        """
+        Salva come replicate le chiavi lette da Google Sheets, sostituendo quelle locali diverse.
+
+        Returns:
+            La lista delle operazioni la cui chiave locale è stata sostituita.
+        """
+        local_keys = self.load_course(course_name)
+        replaced = [operation for operation, values in keys.items()
+                    if operation in local_keys and local_keys[operation] != values]
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """INSERT INTO chiavi (corso, operazione, chiave, iv, replicata, creata_il) VALUES (?, ?, ?, ?, 1, ?)
+                   ON CONFLICT (corso, operazione) DO UPDATE SET chiave = excluded.chiave, iv = excluded.iv, replicata = 1""",
+                [(course_name, operation, self._seal(course_name, operation, key), self._seal(course_name, operation, iv), now)
+                 for operation, (key, iv) in keys.items() if local_keys.get(operation) != (key, iv)])
+            self._conn.executemany("UPDATE chiavi SET replicata = 1 WHERE corso = ? AND operazione = ?",
+                                   [(course_name, operation) for operation, values in keys.items() if local_keys.get(operation) == values])
+        return replaced
+
+    def pending(self):
+        """Restituisce le chiavi non ancora replicate: {corso: {operazione: (chiave, IV)}}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT corso, operazione, chiave, iv FROM chiavi WHERE replicata = 0").fetchall()
+        pending = {}
+        for course_name, operation, key, iv in rows:
+            pending.setdefault(course_name, {})[operation] = (self._open(course_name, operation, key), self._open(course_name, operation, iv))
+        return pending
+
+    def mark_replicated(self, course_name, operation_names):
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE chiavi SET replicata = 1 WHERE corso = ? AND operazione = ?",
+                                   [(course_name, operation) for operation in operation_names])
+
+
+class SheetsKeyChain(KeyChain):
+    """Portachiavi nel foglio ChiaviCorso della cartella di ogni corso su Google Drive."""
+
+    def __init__(self, sync_engine):
+        self.sync_engine = sync_engine
+
+    def get(self, course_name, operation_name):
+        return self.load_course(course_name).get(operation_name, (None, None))
+
+    def load_course(self, course_name):
+        return self.sync_engine.load_keys(course_name)
+
+    def store_keys(self, course_name, keys):
+        return self.sync_engine.store_keys(course_name, keys)
+
+
+class ReplicatedKeyChain(KeyChain):
+    """
+    Portachiavi locale con Google Sheets come replica.
+
+    Le letture di chiavi già presenti usano solo il database locale. Prima di creare una
+    chiave le chiavi del corso vengono riscaricate da Sheets, se raggiungibile, così che
+    venga usata quella creata da un altro dispositivo o da provisionTerm.py; in caso di
+    differenza vale sempre la chiave di Sheets, che è quella usata dall'API per decifrare.
+    Le chiavi nuove vengono salvate subito in locale e replicate su Sheets in background:
+    senza rete la sessione parte comunque e la replica avviene al ripristino della connessione.
+    """
+
+    def __init__(self, local, remote, sync_interval=KEYCHAIN_SYNC_INTERVAL):
+        self.local = local
+        self.remote = remote
+        self.sync_interval = sync_interval
+        self._sync_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def pull_course(self, course_name):
+        """
+        Copia nel database locale le chiavi di un corso presenti su Sheets.
+
+        Returns:
+            True se Sheets è stato letto, False se non è raggiungibile.
+        """
+        try:
+            keys = self.remote.load_course(course_name)
+        except Exception as e:
+            print(f"Chiavi del corso {course_name} non scaricate da Google Sheets, uso solo quelle locali: {e}")
+            return False
+        for operation in self.local.apply_remote(course_name, keys):
+            print(f"La chiave locale di {operation} del corso {course_name} è stata sostituita da quella di Google Sheets.")
+        return True
+
+    def get(self, course_name, operation_name):
+        key, iv = self.local.get(course_name, operation_name)
+        if key is None:
+            self.pull_course(course_name)
+            key, iv = self.local.get(course_name, operation_name)
+        return key, iv
+
+    def load_course(self, course_name):
+        self.pull_course(course_name)
+        return self.local.load_course(course_name)
+
+    def get_or_store(self, course_name, operation_name, key, iv):
+        existing_key, existing_iv = self.local.get(course_name, operation_name)
+        if existing_key is not None:
+            return existing_key, existing_iv
+        # store_keys rilegge già il corso da Sheets
+        stored = self.store_keys(course_name, {operation_name: (key, iv)})[operation_name]
+        return (None, None) if stored == (key, iv) else stored
+
+    def store_keys(self, course_name, keys):
+        # Prima di creare una chiave si controlla che non sia stata aggiunta su Sheets
+        self.pull_course(course_name)
+        existing = self.local.load_course(course_name)
+        stored = self.local.store_keys(course_name, keys)
+        if any(operation not in existing for operation in keys):
+            self._wakeup.set()
+        return stored
+
+    def sync_pending(self):
+        """
+        Scrive su Sheets le chiavi locali non ancora replicate, con una lettura e una scrittura per corso.
+        Se su Sheets esiste già una chiave diversa per la stessa operazione, la chiave locale
+        viene sostituita da quella di Sheets.
+
+        Returns:
+            Il numero di chiavi replicate.
+        """
+        replicated = 0
+        with self._sync_lock:
+            for course_name, keys in self.local.pending().items():
+                try:
+                    remote_keys = self.remote.store_keys(course_name, keys)
+                except Exception as e:
+                    print(f"Errore durante la replica delle chiavi del corso {course_name}: {e}")
+                    continue
+                written = [operation for operation, values in keys.items() if remote_keys.get(operation) == values]
+                conflicts = {operation: remote_keys[operation] for operation in keys
+                             if operation in remote_keys and remote_keys[operation] != keys[operation]}
+                self.local.mark_replicated(course_name, written)
+                for operation in self.local.apply_remote(course_name, conflicts):
+                    print(f"Attenzione: su Google Sheets esiste una chiave diversa per {operation} del corso {course_name}; "
+                          f"i record già cifrati con la chiave locale non saranno decifrabili dall'API.")
+                replicated += len(written)
+        return replicated
+
+    def start(self):
+        """Avvia la replica periodica delle chiavi in un thread in background."""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="keychain-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.sync_pending()
+            self._wakeup.wait(self.sync_interval)
+            self._wakeup.clear()
+
+
+def create_keychain(sync_engine):
+    """Crea il portachiavi del dispositivo: database locale replicato su Google Sheets tramite il motore indicato."""
+    return ReplicatedKeyChain(LocalKeyChain(), SheetsKeyChain(sync_engine))
@@ -4,6 +4,7 @@ import os
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from driveCache import drive_cache, retry_on_not_found
 
 # Definizione degli ambiti di accesso per i servizi Google
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
@@ -51,6 +52,11 @@ def find_or_create_folder(drive_service, folder_name):
     Returns:
         folder_id: L'ID della cartella trovata o creata.
     """
+    # Controlla prima la cache locale degli ID
+    folder_id = drive_cache.get('folder', folder_name, None)
+    if folder_id:
+        return folder_id
+
     # Query per trovare la cartella con il nome specificato
     query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}'"
     response = drive_service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
@@ -60,9 +66,11 @@ def find_or_create_folder(drive_service, folder_name):
     if not folders:
         file_metadata = {'name': folder_name, 'mimeType': 'application/vnd.google-apps.folder'}
         folder = drive_service.files().create(body=file_metadata, fields='id').execute()
-        return folder.get('id')
+        folder_id = folder.get('id')
     else:
-        return folders[0].get('id')
+        folder_id = folders[0].get('id')
+    drive_cache.set(folder_id, 'folder', folder_name, None)
+    return folder_id
 
 def find_or_create_sheet(drive_service, sheets_service, folder_id, sheet_name):
     """
@@ -77,6 +85,11 @@ def find_or_create_sheet(drive_service, sheets_service, folder_id, sheet_name):
     Returns:
         sheet_id: L'ID del foglio trovato o creato.
     """
+    # Controlla prima la cache locale degli ID
+    sheet_id = drive_cache.get('sheet', folder_id, sheet_name)
+    if sheet_id:
+        return sheet_id
+
     # Query per trovare il foglio con il nome specificato all'interno della cartella
     query = f"name='{sheet_name}' and mimeType='application/vnd.google-apps.spreadsheet' and '{folder_id}' in parents"
     response = drive_service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
@@ -92,9 +105,10 @@ def find_or_create_sheet(drive_service, sheets_service, folder_id, sheet_name):
         sheet = drive_service.files().create(body=file_metadata, fields='id').execute()
         sheet_id = sheet.get('id')
         setup_sheet(sheets_service, sheet_id)
-        return sheet_id
     else:
-        return files[0]['id']
+        sheet_id = files[0]['id']
+    drive_cache.set(sheet_id, 'sheet', folder_id, sheet_name)
+    return sheet_id
 
 def setup_sheet(sheets_service, sheet_id):
     """
@@ -155,6 +169,80 @@ def check_existing_key(sheets_service, sheet_id, operation_name):
         print(f"Errore durante la verifica della chiave esistente: {e}")
     return None, None  # Restituisce None se non trovato
 
+def load_course_keys(sheets_service, sheet_id):
+    """
+    Scarica in una sola richiesta tutte le chiavi di un foglio ChiaviCorso.
+
+    Returns:
+        Dizionario {operazione: (chiave, IV)}; per le operazioni ripetute vale la prima riga.
+    """
+    result = sheets_service.spreadsheets().values().get(spreadsheetId=sheet_id, range='A:C').execute()
+    keys = {}
+    for row in result.get('values', [])[1:]:
+        if len(row) >= 3 and row[0] not in keys:
+            keys[row[0]] = (row[1], row[2])
+    return keys
+
+@retry_on_not_found
+def get_course_keys(drive_service, sheets_service, cartella_destinazione):
+    """Restituisce tutte le chiavi del corso: {operazione: (chiave, IV)}."""
+    folder_id = find_or_create_folder(drive_service, cartella_destinazione)
+    sheet_id = find_or_create_sheet(drive_service, sheets_service, folder_id, "ChiaviCorso")
+    return load_course_keys(sheets_service, sheet_id)
+
+@retry_on_not_found
+def store_keys(drive_service, sheets_service, cartella_destinazione, keys):
+    """
+    Aggiunge al foglio ChiaviCorso le chiavi delle operazioni che non ne hanno ancora una,
+    con un'unica lettura e un'unica scrittura del foglio.
+
+    Args:
+        drive_service: Il servizio autenticato di Google Drive.
+        sheets_service: Il servizio autenticato di Google Sheets.
+        cartella_destinazione: Il nome della cartella del corso.
+        keys: Dizionario {operazione: (chiave, IV)} delle chiavi da salvare.
+
+    Returns:
+        Tutte le chiavi del corso dopo il salvataggio: {operazione: (chiave, IV)}.
+    """
+    folder_id = find_or_create_folder(drive_service, cartella_destinazione)
+    sheet_id = find_or_create_sheet(drive_service, sheets_service, folder_id, "ChiaviCorso")
+    existing = load_course_keys(sheets_service, sheet_id)
+    rows = [[operation, key, iv] for operation, (key, iv) in keys.items() if operation not in existing]
+    if rows:
+        sheets_service.spreadsheets().values().append(
+            spreadsheetId=sheet_id, range='A:C', valueInputOption='USER_ENTERED',
+            insertDataOption='INSERT_ROWS', body={'values': rows}).execute()
+        existing.update({operation: (key, iv) for operation, key, iv in rows})
+    return existing
+
+@retry_on_not_found
+def get_or_store_key(drive_service, sheets_service, nome_file, cartella_destinazione, chiave, iv):
+    """
+    Restituisce la chiave e l'IV già salvati per un'operazione, oppure salva quelli forniti.
+
+    Args:
+        drive_service: Il servizio autenticato di Google Drive.
+        sheets_service: Il servizio autenticato di Google Sheets.
+        nome_file: Il nome dell'operazione (es. 'Registrazione', nome della lezione o data dell'esame).
+        cartella_destinazione: Il nome della cartella del corso.
+        chiave: La nuova chiave da salvare se non ne esiste già una.
+        iv: Il nuovo IV da salvare se non ne esiste già uno.
+
+    Returns:
+        Tuple contenente (key, IV) esistenti se trovati, altrimenti (None, None) dopo aver salvato i nuovi dati.
+    """
+    folder_id = find_or_create_folder(drive_service, cartella_destinazione)
+    sheet_id = find_or_create_sheet(drive_service, sheets_service, folder_id, "ChiaviCorso")
+
+    existing_key, existing_iv = check_existing_key(sheets_service, sheet_id, nome_file)
+    if existing_key and existing_iv:
+        return existing_key, existing_iv
+
+    data = [nome_file, chiave, iv]  # Include IV nei dati
+    append_data_to_sheet(sheets_service, sheet_id, data)
+    return None, None
+
 if __name__ == "__main__":
     # Verifica gli argomenti della riga di comando
     if len(sys.argv) != 6:
@@ -163,13 +251,9 @@ if __name__ == "__main__":
 
     tipo_foglio, nome_file, cartella_destinazione, chiave, iv = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5]
     drive_service, sheets_service = authenticate_google_services()
-    folder_id = find_or_create_folder(drive_service, cartella_destinazione)
-    sheet_id = find_or_create_sheet(drive_service, sheets_service, folder_id, "ChiaviCorso")
 
-    existing_key, existing_iv = check_existing_key(sheets_service, sheet_id, nome_file)
+    existing_key, existing_iv = get_or_store_key(drive_service, sheets_service, nome_file, cartella_destinazione, chiave, iv)
     if existing_key and existing_iv:
         print(existing_key, existing_iv)  # Stampa la chiave e l'IV esistenti se trovati
     else:
-        data = [nome_file, chiave, iv]  # Include IV nei dati
-        append_data_to_sheet(sheets_service, sheet_id, data)
         print(1)  # Indica che nessuna chiave esistente è stata trovata e sono stati aggiunti nuovi dati
@@ -0,0 +1,421 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+import time
+
+from courseDatabase import course_pool
+
+# Stati possibili di un elemento dell'outbox
+STATUS_PENDING = 'pending'
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Destinazioni gestite dal dispositivo
+TARGET_SHEETS = 'sheets'
+TARGET_BLOCKCHAIN = 'blockchain'
+# Identificativo dell'avvio del sistema, per non confondere i PID di un avvio precedente
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+
+def _boot_id():
+    try:
+        with open(BOOT_ID_FILE) as file:
+            return file.read().strip()
+    except OSError:
+        return ''
+
+
+BOOT_ID = _boot_id()
+
+
+def current_owner():
+    """Restituisce il proprietario da associare agli elementi presi in carico dal processo corrente."""
+    return f"{BOOT_ID}:{os.getpid()}"
+
+
+def owner_alive(owner):
+    """Indica se il processo che ha preso in carico un elemento è ancora in esecuzione."""
+    if not owner:
+        return False
+    boot_id, _, pid = owner.rpartition(':')
+    if boot_id != BOOT_ID or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Outbox:
+    """
+    Outbox persistente per le scritture verso Google Sheets e blockchain.
+
+    Ogni scansione viene salvata nella tabella 'outbox' del database SQLite del corso
+    (lo stesso che contiene la tabella 'studenti'): il salvataggio richiede pochi
+    millisecondi e sopravvive a un riavvio del dispositivo. Un thread per ogni
+    destinazione svuota la coda in background, con tentativi ripetuti e backoff
+    esponenziale in caso di errore.
+    Gli elementi 'in_progress' registrano il processo che li ha presi in carico, così che
+    più processi (es. il demone e importRoster.py) possano usare la stessa outbox.
+    """
+
+    def __init__(self, database, max_attempts=10, base_delay=1.0, max_delay=300.0, poll_interval=1.0):
+        self.database = database
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._wakeups = {}
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._flush_requested = set()
+        self.create_table()
+
+    def create_table(self):
+        """Crea la tabella dell'outbox se non esiste."""
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        target TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at REAL NOT NULL,
+                        last_error TEXT,
+                        owner TEXT,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                """)
+                # Le tabelle create prima dell'introduzione della colonna 'owner' vengono aggiornate
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(outbox)")]
+                if 'owner' not in columns:
+                    conn.execute("ALTER TABLE outbox ADD COLUMN owner TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (target, status, next_attempt_at)")
+
+    def register_handler(self, target, handler):
+        """
+        Registra la funzione che invia un elemento alla destinazione indicata.
+
+        Args:
+            target: La destinazione (es. 'sheets' o 'blockchain').
+            handler: Funzione che riceve il payload e solleva un'eccezione in caso di errore.
+        """
+        self._handlers[target] = (handler, 1, 0.0, False)
+        self._wakeups[target] = threading.Event()
+
+    def register_batch_handler(self, target, handler, max_items=50, max_delay=2.0):
+        """
+        Registra una funzione che invia più elementi della stessa destinazione in un'unica richiesta.
+
+        Gli elementi vengono raccolti finché non se ne accumulano max_items oppure finché
+        il più vecchio non resta in coda per max_delay secondi, o fino a una chiamata a flush().
+
+        Args:
+            target: La destinazione degli elementi.
+            handler: Funzione che riceve la lista dei payload e restituisce None se tutti gli invii
+                sono riusciti, oppure una lista con l'errore (o None) di ciascun elemento.
+            max_items: Numero massimo di elementi per richiesta.
+            max_delay: Secondi massimi di attesa prima dell'invio di un gruppo incompleto.
+        """
+        self._handlers[target] = (handler, max_items, max_delay, True)
+        self._wakeups[target] = threading.Event()
+
+    def flush(self, target=None):
+        """Chiede l'invio immediato degli elementi in coda senza attendere che i gruppi si completino."""
+        targets = [target] if target else list(self._wakeups)
+        for name in targets:
+            self._flush_requested.add(name)
+            self._wakeups[name].set()
+
+    def enqueue(self, target, payload):
+        """
+        Salva un nuovo elemento nell'outbox.
+
+        Args:
+            target: La destinazione dell'elemento.
+            payload: Dizionario serializzabile in JSON con i dati da inviare.
+
+        Returns:
+            L'ID dell'elemento inserito.
+        """
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                item_id = self.enqueue_in(conn, [(target, payload)])[0]
+        self.wake([target])
+        return item_id
+
+    def enqueue_many(self, target, payloads):
+        """
+        Salva più elementi della stessa destinazione in un'unica transazione.
+
+        Returns:
+            Il numero di elementi inseriti.
+        """
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                self.enqueue_in(conn, [(target, payload) for payload in payloads])
+        self.wake([target])
+        return len(payloads)
+
+    def enqueue_in(self, conn, items, status=STATUS_PENDING):
+        """
+        Inserisce elementi nell'outbox con una connessione al database del corso, senza confermare
+        la transazione: chi chiama li salva insieme alle proprie scritture con un unico commit,
+        e dopo il commit chiama wake() con le destinazioni degli elementi.
+
+        Args:
+            conn: Connessione al database del corso, con una transazione in corso.
+            items: Lista di tuple (destinazione, payload).
+            status: STATUS_IN_PROGRESS se chi chiama prova a inviarli direttamente; in quel caso
+                li conclude con complete() o release().
+
+        Returns:
+            La lista degli ID degli elementi inseriti.
+        """
+        now = time.time()
+        owner = current_owner() if status == STATUS_IN_PROGRESS else None
+        return [conn.execute("""
+                    INSERT INTO outbox (target, payload, status, owner, next_attempt_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (target, json.dumps(payload), status, owner, now, now, now)).lastrowid
+                for target, payload in items]
+
+    def complete(self, item_ids):
+        """Segna come inviati gli elementi inviati direttamente da chi li ha accodati."""
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                conn.executemany("UPDATE outbox SET status = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                                 [(STATUS_DONE, time.time(), item_id) for item_id in item_ids])
+
+    def release(self, item_ids, error=None):
+        """Rimette in coda gli elementi che chi li ha accodati non è riuscito a inviare direttamente."""
+        now = time.time()
+        targets = set()
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                conn.executemany("UPDATE outbox SET status = ?, owner = NULL, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                                 [(STATUS_PENDING, error, now, now, item_id) for item_id in item_ids])
+                # Una query per elemento: un elenco IN con un parametro per ID supererebbe il limite di SQLite
+                for item_id in item_ids:
+                    row = conn.execute("SELECT target FROM outbox WHERE id = ?", (item_id,)).fetchone()
+                    if row is not None:
+                        targets.add(row[0])
+        self.wake(targets)
+
+    def wake(self, targets):
+        """Sveglia i thread di invio delle destinazioni indicate."""
+        for target in targets:
+            if target in self._wakeups:
+                self._wakeups[target].set()
+
+    def start(self):
+        """Avvia un thread di invio per ogni destinazione registrata."""
+        if self._threads:
+            return
+        self.reclaim_orphaned()
+        self._stop_event.clear()
+        for target in self._handlers:
+            thread = threading.Thread(target=self._worker, args=(target,), name=f"outbox-{target}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def reclaim_orphaned(self):
+        """
+        Rimette in coda gli elementi 'in_progress' presi in carico da un processo terminato.
+
+        Gli elementi di un processo ancora in esecuzione (es. importRoster.py che invia
+        direttamente gli studenti importati) restano a quel processo.
+
+        Returns:
+            Il numero di elementi rimessi in coda.
+        """
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                owners = [row[0] for row in conn.execute("SELECT DISTINCT owner FROM outbox WHERE status = ?",
+                                                         (STATUS_IN_PROGRESS,))]
+                count = 0
+                for owner in owners:
+                    if owner_alive(owner):
+                        continue
+                    count += conn.execute("UPDATE outbox SET status = ?, owner = NULL WHERE status = ? AND owner IS ?",
+                                          (STATUS_PENDING, STATUS_IN_PROGRESS, owner)).rowcount
+        return count
+
+    def stop(self, timeout=5.0):
+        """Ferma i thread di invio; gli elementi non inviati restano salvati nel database."""
+        self._stop_event.set()
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def queue_depth(self, target=None):
+        """
+        Restituisce il numero di elementi per stato.
+
+        Args:
+            target: (Opzionale) Limita il conteggio a una destinazione.
+
+        Returns:
+            Dizionario {stato: numero di elementi}.
+        """
+        query = "SELECT status, COUNT(*) FROM outbox"
+        params = ()
+        if target:
+            query += " WHERE target = ?"
+            params = (target,)
+        query += " GROUP BY status"
+        with course_pool.connection(self.database) as conn:
+            depth = {STATUS_PENDING: 0, STATUS_IN_PROGRESS: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+            depth.update(dict(conn.execute(query, params).fetchall()))
+            return depth
+
+    def get_item(self, item_id):
+        """Restituisce lo stato di un elemento dell'outbox, o None se non esiste."""
+        items = self._select("SELECT * FROM outbox WHERE id = ?", (item_id,))
+        return items[0] if items else None
+
+    def list_items(self, status=None, target=None, limit=100):
+        """Restituisce gli ultimi elementi dell'outbox, filtrati per stato e destinazione."""
+        query = "SELECT * FROM outbox WHERE 1 = 1"
+        params = []
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if target:
+            query += " AND target = ?"
+            params.append(target)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return self._select(query, params)
+
+    def retry_failed(self, target=None):
+        """Rimette in coda gli elementi falliti. Restituisce il numero di elementi ripristinati."""
+        query = "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ? WHERE status = ?"
+        now = time.time()
+        params = [STATUS_PENDING, now, now, STATUS_FAILED]
+        if target:
+            query += " AND target = ?"
+            params.append(target)
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                count = conn.execute(query, params).rowcount
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+        return count
+
+    def _select(self, query, params):
+        with course_pool.connection(self.database) as conn:
+            cursor = conn.execute(query, params)
+            cursor.row_factory = sqlite3.Row
+            items = []
+            for row in cursor.fetchall():
+                item = dict(row)
+                item['payload'] = json.loads(item['payload'])
+                items.append(item)
+            return items
+
+    def _claim_batch(self, conn, target, max_items, max_delay):
+        """
+        Prende in carico fino a max_items elementi pronti per l'invio.
+
+        Se gli elementi pronti sono meno di max_items, il più vecchio è in coda da meno di
+        max_delay secondi e non è stato richiesto uno svuotamento forzato, non prende in
+        carico nulla e restituisce i secondi da attendere prima di riprovare.
+
+        Returns:
+            Tuple (righe prese in carico, secondi di attesa).
+        """
+        now = time.time()
+        with conn:
+            rows = conn.execute("""
+                SELECT id, payload, attempts, created_at FROM outbox
+                WHERE target = ? AND status = ? AND next_attempt_at <= ?
+                ORDER BY id LIMIT ?
+            """, (target, STATUS_PENDING, now, max_items)).fetchall()
+            if not rows:
+                self._flush_requested.discard(target)
+                return [], self.poll_interval
+            age = now - min(row[3] for row in rows)
+            if len(rows) < max_items and age < max_delay and target not in self._flush_requested:
+                return [], max_delay - age
+            owner = current_owner()
+            conn.executemany("UPDATE outbox SET status = ?, owner = ?, updated_at = ? WHERE id = ?",
+                             [(STATUS_IN_PROGRESS, owner, now, row[0]) for row in rows])
+        return rows, 0
+
+    def _mark_done(self, conn, item_id):
+        with conn:
+            conn.execute("UPDATE outbox SET status = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                         (STATUS_DONE, time.time(), item_id))
+
+    def _mark_error(self, conn, item_id, attempts, error):
+        """Registra un errore e pianifica un nuovo tentativo con backoff esponenziale."""
+        now = time.time()
+        if attempts >= self.max_attempts:
+            status, next_attempt_at = STATUS_FAILED, now
+        else:
+            status = STATUS_PENDING
+            next_attempt_at = now + min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        with conn:
+            conn.execute("""
+                UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ?
+            """, (status, attempts, next_attempt_at, str(error), now, item_id))
+
+    def _worker(self, target):
+        """Ciclo di invio degli elementi di una destinazione."""
+        handler, max_items, max_delay, batch = self._handlers[target]
+        wakeup = self._wakeups[target]
+        with course_pool.connection(self.database) as conn:
+            while not self._stop_event.is_set():
+                rows, wait = self._claim_batch(conn, target, max_items, max_delay)
+                if not rows:
+                    wakeup.wait(wait)
+                    wakeup.clear()
+                    continue
+                payloads = [json.loads(row[1]) for row in rows]
+                if batch:
+                    try:
+                        errors = handler(payloads) or [None] * len(rows)
+                    except Exception as e:
+                        errors = [e] * len(rows)
+                else:
+                    errors = []
+                    for payload in payloads:
+                        try:
+                            handler(payload)
+                            errors.append(None)
+                        except Exception as e:
+                            errors.append(e)
+                for row, error in zip(rows, errors):
+                    item_id, attempts = row[0], row[2] + 1
+                    if error is None:
+                        self._mark_done(conn, item_id)
+                    else:
+                        print(f"Errore durante l'invio dell'elemento {item_id} a {target} (tentativo {attempts}): {error}")
+                        self._mark_error(conn, item_id, attempts, error)
+
+if __name__ == "__main__":
+    # Mostra lo stato dell'outbox di un corso
+    if len(sys.argv) not in [2, 3]:
+        print("Uso: python outbox.py <database_corso> [stato]")
+        sys.exit(1)
+
+    outbox = Outbox(sys.argv[1])
+    print(f"Elementi in coda: {outbox.queue_depth()}")
+    for item in outbox.list_items(status=sys.argv[2] if len(sys.argv) == 3 else None):
+        print(f"{item['id']} {item['target']} {item['status']} tentativi={item['attempts']} errore={item['last_error']}")
@@ -0,0 +1,208 @@
+import sys
+import csv
+
+import createGsheet
+import keyChainGsheet
+from driveCache import drive_cache
+from recordCodec import encode_bytes
+from aesCipher import generate_aes_key, generate_aes_iv
+from keyChain import LocalKeyChain
+
+# Numero massimo di richieste in una singola richiesta batch delle API di Google
+GOOGLE_BATCH_MAX_SIZE = 100
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+
+CALENDAR_SHEET_TYPES = {'lezione': 'L', 'esame': 'E'}
+
+
+def read_calendar_csv(path):
+    """
+    Legge il calendario di un corso da un file CSV con le colonne (tipo, nome), dove tipo
+    è 'Lezione' o 'Esame' e nome è il nome della lezione o la data dell'esame.
+    La prima riga viene ignorata se è un'intestazione.
+
+    Returns:
+        La lista delle tuple (tipo di foglio, nome), senza duplicati.
+    """
+    sessions = []
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        for line_number, row in enumerate(csv.reader(file), 1):
+            row = [value.strip() for value in row]
+            if not any(row):
+                continue
+            if line_number == 1 and row[0].lower() == 'tipo':
+                continue
+            if len(row) != 2 or row[0].lower() not in CALENDAR_SHEET_TYPES or not row[1]:
+                print(f"Riga {line_number} ignorata, servono tipo (Lezione o Esame) e nome: {row}")
+                continue
+            session = (CALENDAR_SHEET_TYPES[row[0].lower()], row[1])
+            if session not in sessions:
+                sessions.append(session)
+    return sessions
+
+
+def execute_batch(service, requests):
+    """
+    Esegue le richieste indicate con richieste batch di al massimo GOOGLE_BATCH_MAX_SIZE elementi.
+
+    Args:
+        service: Il servizio Google che crea le richieste batch.
+        requests: Lista di tuple (chiave, richiesta).
+
+    Returns:
+        Tuple (risposte per chiave, errori per chiave).
+    """
+    responses, errors = {}, {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            responses[request_id] = response
+
+    for start in range(0, len(requests), GOOGLE_BATCH_MAX_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for key, request in requests[start:start + GOOGLE_BATCH_MAX_SIZE]:
+            batch.add(request, request_id=key)
+        batch.execute()
+    return responses, errors
+
+
+def list_spreadsheets(drive_service, folder_id):
+    """Restituisce un dizionario nome -> ID dei fogli di calcolo presenti in una cartella."""
+    spreadsheets = {}
+    page_token = None
+    while True:
+        response = drive_service.files().list(
+            q=f"mimeType='{SPREADSHEET_MIME_TYPE}' and '{folder_id}' in parents and trashed=false",
+            spaces='drive', fields='nextPageToken, files(id, name)', pageSize=1000, pageToken=page_token).execute()
+        for file in response.get('files', []):
+            spreadsheets.setdefault(file['name'], file['id'])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return spreadsheets
+
+
+def header_request(sheet_type):
+    """Richieste batchUpdate che rinominano il primo foglio con il tipo e scrivono le intestazioni."""
+    headers = createGsheet.SHEET_HEADERS[sheet_type][0]
+    return [
+        {'updateSheetProperties': {'properties': {'sheetId': 0, 'title': sheet_type}, 'fields': 'title'}},
+        {'updateCells': {
+            'start': {'sheetId': 0, 'rowIndex': 0, 'columnIndex': 0},
+            'rows': [{'values': [{'userEnteredValue': {'stringValue': header}} for header in headers]}],
+            'fields': 'userEnteredValue'
+        }}
+    ]
+
+
+def cache_sheet(sheet_id, course_name, folder_id, name):
+    """
+    Salva nella cache locale, senza scadenza, l'ID di un foglio del corso: sia per cartella
+    (usato da createGsheet) sia per corso (usato da updateGsheet per aggiungere le righe).
+    """
+    drive_cache.set(sheet_id, 'sheet', folder_id, name, permanent=True)
+    drive_cache.set(sheet_id, 'resolved', course_name, name, permanent=True)
+
+
+def provision_sheets(drive_service, sheets_service, course_name, sessions):
+    """
+    Crea i fogli mancanti delle sessioni di un corso e ne salva gli ID nella cache locale.
+
+    I fogli già presenti vengono trovati con un elenco per cartella; quelli mancanti vengono
+    creati direttamente nella cartella giusta con richieste batch di Drive, e le intestazioni
+    scritte con richieste batch di Sheets. Gli ID restano in cache per tutto il semestre.
+
+    Returns:
+        Il numero di fogli creati.
+    """
+    main_folder_id = createGsheet.find_or_create_folder(drive_service, course_name)
+    drive_cache.set(main_folder_id, 'folder', course_name, None, permanent=True)
+    folders = {'R': main_folder_id, 'L': main_folder_id}
+    if any(sheet_type == 'E' for sheet_type, _ in sessions):
+        folders['E'] = createGsheet.find_or_create_folder(drive_service, "Esami", main_folder_id)
+        drive_cache.set(folders['E'], 'folder', "Esami", main_folder_id, permanent=True)
+    existing = {folder_id: list_spreadsheets(drive_service, folder_id) for folder_id in set(folders.values())}
+
+    missing = []
+    for sheet_type, name in sessions:
+        folder_id = folders[sheet_type]
+        sheet_id = existing[folder_id].get(name)
+        if sheet_id:
+            cache_sheet(sheet_id, course_name, folder_id, name)
+        else:
+            missing.append((sheet_type, name))
+    print(f"{len(sessions) - len(missing)} fogli già presenti, {len(missing)} da creare.")
+    if not missing:
+        return 0
+
+    created, errors = execute_batch(drive_service, [
+        (str(index), drive_service.files().create(
+            body={'name': name, 'mimeType': SPREADSHEET_MIME_TYPE, 'parents': [folders[sheet_type]]}, fields='id'))
+        for index, (sheet_type, name) in enumerate(missing)
+    ])
+    for index, error in errors.items():
+        print(f"Errore durante la creazione del foglio '{missing[int(index)][1]}': {error}")
+
+    _, header_errors = execute_batch(sheets_service, [
+        (index, sheets_service.spreadsheets().batchUpdate(
+            spreadsheetId=response['id'], body={'requests': header_request(missing[int(index)][0])}))
+        for index, response in created.items()
+    ])
+    for index, error in header_errors.items():
+        print(f"Errore durante la scrittura delle intestazioni di '{missing[int(index)][1]}': {error}")
+
+    # Un foglio senza intestazioni viene comunque salvato in cache: le righe possono essere aggiunte lo stesso
+    for index, response in created.items():
+        sheet_type, name = missing[int(index)]
+        cache_sheet(response['id'], course_name, folders[sheet_type], name)
+    return len(created)
+
+
+def provision_keys(drive_service, sheets_service, course_name, operation_names, local_keychain=None):
+    """
+    Aggiunge al foglio ChiaviCorso una chiave e un IV per ogni operazione che non ne ha ancora,
+    con un'unica lettura e un'unica scrittura del foglio, e copia tutte le chiavi del corso
+    nel portachiavi locale del dispositivo.
+
+    Returns:
+        Il numero di chiavi create.
+    """
+    new_keys = {name: (encode_bytes(generate_aes_key()), encode_bytes(generate_aes_iv())) for name in operation_names}
+    keys = keyChainGsheet.store_keys(drive_service, sheets_service, course_name, new_keys)
+    created = sum(1 for name in operation_names if keys[name] == new_keys[name])
+    local_keychain = local_keychain or LocalKeyChain()
+    local_keychain.apply_remote(course_name, keys)
+    print(f"{len(operation_names) - created} chiavi già presenti, {created} create.")
+    return created
+
+
+def provision_term(drive_service, sheets_service, course_name, sessions):
+    """
+    Prepara in anticipo cartelle, fogli e chiavi di tutte le sessioni di un corso,
+    compreso il foglio Registrazione, così che l'avvio di una sessione non richieda scritture su Google.
+    Le chiavi vengono copiate anche nel portachiavi locale, da cui l'avvio le legge senza rete.
+
+    Args:
+        drive_service: Il servizio autenticato di Google Drive.
+        sheets_service: Il servizio autenticato di Google Sheets.
+        course_name: Il nome del corso.
+        sessions: Lista di tuple (tipo di foglio, nome) delle lezioni ('L') e degli esami ('E').
+    """
+    sessions = [('R', "Registrazione")] + [session for session in sessions if session != ('R', "Registrazione")]
+    created_sheets = provision_sheets(drive_service, sheets_service, course_name, sessions)
+    created_keys = provision_keys(drive_service, sheets_service, course_name, [name for _, name in sessions])
+    return created_sheets, created_keys
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python provisionTerm.py <nome_corso> <calendario_csv>")
+        sys.exit(1)
+
+    course_name, path = sys.argv[1], sys.argv[2]
+    sessions = read_calendar_csv(path)
+    print(f"{len(sessions)} sessioni lette da {path}.")
+    drive_service, sheets_service = createGsheet.authenticate_google_services()
+    created_sheets, created_keys = provision_term(drive_service, sheets_service, course_name, sessions)
+    print(f"Corso {course_name} pronto: {created_sheets} fogli e {created_keys} chiavi creati.")
@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+
+import RPi.GPIO as GPIO
+from mfrc522 import SimpleMFRC522
+
+# Secondi tra due letture consecutive del lettore
+READER_POLL_INTERVAL = 0.1
+# Letture dello stesso tag entro questo intervallo vengono considerate un'unica scansione
+READER_DEBOUNCE_SECONDS = 2.0
+
+
+class TagEvent:
+    """Scansione di un tag: ID letto e istante della lettura."""
+
+    def __init__(self, tag_id, read_at):
+        self.tag_id = tag_id
+        self.read_at = read_at
+
+    def __repr__(self):
+        return f"TagEvent({self.tag_id}, {self.read_at})"
+
+
+class RFIDReaderService:
+    """
+    Servizio di lettura continua del lettore RFID MFRC522.
+
+    Un thread dedicato possiede l'unica istanza del lettore e la interroga senza bloccare
+    (read_id_no_block), così che l'interfaccia Tk non resti mai ferma in attesa di un tag.
+    Ogni nuova scansione viene messa nella coda 'events' come TagEvent; le letture ripetute
+    dello stesso tag, finché resta appoggiato al lettore o entro READER_DEBOUNCE_SECONDS,
+    vengono scartate.
+    """
+
+    def __init__(self, poll_interval=READER_POLL_INTERVAL, debounce_seconds=READER_DEBOUNCE_SECONDS):
+        self.poll_interval = poll_interval
+        self.debounce_seconds = debounce_seconds
+        self.events = queue.Queue()
+        self._reader = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._last_tag = None
+        self._last_seen = 0.0
+
+    def start(self):
+        """Avvia il thread di lettura."""
+        if self._thread is not None:
+            return
+        GPIO.setwarnings(False)
+        self._reader = SimpleMFRC522()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="rfid-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ferma il thread di lettura e rilascia i pin GPIO."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        GPIO.cleanup()
+
+    def _accept(self, tag_id, now):
+        """Indica se la lettura è una nuova scansione e aggiorna lo stato del debounce."""
+        repeated = tag_id == self._last_tag and now - self._last_seen < self.debounce_seconds
+        self._last_tag = tag_id
+        self._last_seen = now
+        return not repeated
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                tag_id = self._reader.read_id_no_block()
+            except Exception as e:
+                print(f"Errore lettura tag: {e}")
+                tag_id = None
+            if tag_id is not None:
+                now = time.time()
+                if self._accept(tag_id, now):
+                    self.events.put(TagEvent(tag_id, now))
+            self._stop_event.wait(self.poll_interval)
+
+    def get_events(self):
+        """Restituisce, senza attendere, tutte le scansioni in coda."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
@@ -1,6 +1,10 @@
 import sys
 import os
+import time
+import threading
+from concurrent.futures import Future
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
 
 # Connessione a Ganache
 ganache_url = "http://172.20.10.14:7545"
@@ -13,23 +17,281 @@ else:
 
 
 # ABI e indirizzo dello smart contract
-contract_abi = [{'anonymous': False, 'inputs': [{'indexed': False, 'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'indexed': False, 'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'indexed': False, 'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}, {'indexed': False, 'internalType': 'string', 'name': 'encryptedId', 'type': 'string'}], 'name': 'RecordCreated', 'type': 'event'}, {'inputs': [{'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}, {'internalType': 'string', 'name': 'encryptedId', 'type': 'string'}], 'name': 'addRecord', 'outputs': [], 'stateMutability': 'nonpayable', 'type': 'function'}, {'inputs': [{'internalType': 'string', 'name': 'courseName', 'type': 'string'}], 'name': 'countRegistrations', 'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}, {'inputs': [{'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'lessonName', 'type': 'string'}], 'name': 'countLessonAttendances', 'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}, {'inputs': [{'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'examDate', 'type': 'string'}], 'name': 'countExamParticipations', 'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}, {'inputs': [{'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}], 'name': 'getRecordsByOperation', 'outputs': [{'components': [{'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}, {'internalType': 'string', 'name': 'encryptedId', 'type': 'string'}], 'internalType': 'struct AttendanceTracker.Record[]', 'name': '', 'type': 'tuple[]'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}]
+contract_abi = [{'anonymous': False, 'inputs': [{'indexed': False, 'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'indexed': False, 'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'indexed': False, 'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}, {'indexed': False, 'internalType': 'string', 'name': 'encryptedId', 'type': 'string'}], 'name': 'RecordCreated', 'type': 'event'}, {'inputs': [{'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}, {'internalType': 'string', 'name': 'encryptedId', 'type': 'string'}], 'name': 'addRecord', 'outputs': [], 'stateMutability': 'nonpayable', 'type': 'function'}, {'inputs': [{'components': [{'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}, {'internalType': 'string', 'name': 'encryptedId', 'type': 'string'}], 'internalType': 'struct AttendanceTracker.Record[]', 'name': 'newRecords', 'type': 'tuple[]'}], 'name': 'addRecords', 'outputs': [], 'stateMutability': 'nonpayable', 'type': 'function'}, {'inputs': [{'internalType': 'string', 'name': 'courseName', 'type': 'string'}], 'name': 'countRegistrations', 'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}, {'inputs': [{'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'lessonName', 'type': 'string'}], 'name': 'countLessonAttendances', 'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}, {'inputs': [{'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'examDate', 'type': 'string'}], 'name': 'countExamParticipations', 'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}, {'inputs': [{'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}], 'name': 'getRecordsByOperation', 'outputs': [{'components': [{'internalType': 'string', 'name': 'operationType', 'type': 'string'}, {'internalType': 'string', 'name': 'courseName', 'type': 'string'}, {'internalType': 'string', 'name': 'additionalInfo', 'type': 'string'}, {'internalType': 'string', 'name': 'encryptedId', 'type': 'string'}], 'internalType': 'struct AttendanceTracker.Record[]', 'name': '', 'type': 'tuple[]'}], 'stateMutability': 'view', 'type': 'function', 'constant': True}]
 contract_address = '0x8F510086386477235FC73e11Bc585Bfdfd748a91' # Sostituisci ... con l'indirizzo effettivo del contract
 
 # Creazione di un'istanza del contract
 contract = web3.eth.contract(address=contract_address, abi=contract_abi)
 
-def add_record(operation_type, course_name, additional_info, encrypted_id):
-    accounts = web3.eth.accounts
+# Numero massimo di record inviati con una singola transazione addRecords; i gruppi vengono
+# comunque ridotti finché il gas stimato non rientra in BLOCK_GAS_SHARE del limite del blocco
+RECORDS_BATCH_MAX_SIZE = 32
+# Margine applicato al gas stimato di una transazione
+GAS_MARGIN = 1.2
+# Frazione del limite di gas del blocco utilizzabile da una transazione, margine compreso
+BLOCK_GAS_SHARE = 0.9
+# Secondi massimi di attesa di un gruppo di record incompleto nell'outbox
+RECORDS_BATCH_MAX_DELAY = 2.0
+# Numero massimo di transazioni inviate e non ancora confermate
+MAX_IN_FLIGHT = 8
+# Secondi tra due controlli delle ricevute e tempo massimo di attesa di una ricevuta
+RECEIPT_POLL_INTERVAL = 0.05
+RECEIPT_TIMEOUT = 120
+# Gas di una transazione addRecord
+ADD_RECORD_GAS = 500000
+
+
+class RecordCountTracker:
+    """
+    Conteggio dei record confermati dalle transazioni inviate da questo processo.
+
+    I conteggi vengono ricavati dagli eventi RecordCreated delle ricevute, senza interrogare
+    il contract dopo ogni scrittura. Partono da zero, oppure dal totale presente sulla catena
+    indicato con seed (vedi chain_count).
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(operation_type, course_name, additional_info):
+        # Le registrazioni si contano per corso, come in countRegistrations
+        return (operation_type, course_name, "" if operation_type == "Registrazione" else additional_info)
+
+    def seed(self, operation_type, course_name, additional_info, count):
+        with self._lock:
+            self._counts[self._key(operation_type, course_name, additional_info)] = count
+
+    def add(self, operation_type, course_name, additional_info, count=1):
+        with self._lock:
+            key = self._key(operation_type, course_name, additional_info)
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def add_receipt(self, receipt):
+        """Aggiunge ai conteggi i record creati da una transazione confermata."""
+        for event in contract.events.RecordCreated().process_receipt(receipt):
+            self.add(event['args']['operationType'], event['args']['courseName'], event['args']['additionalInfo'])
+
+    def count(self, operation_type, course_name, additional_info=""):
+        with self._lock:
+            return self._counts.get(self._key(operation_type, course_name, additional_info), 0)
+
+
+class PipelinedSender:
+    """
+    Invio di transazioni al contract senza attendere la conferma di ciascuna.
+
+    L'account viene letto una sola volta e il nonce è gestito localmente: ogni transazione
+    riceve il nonce successivo e viene inviata subito, finché le transazioni in attesa di
+    conferma non raggiungono max_in_flight. Un thread raccoglie le ricevute in background
+    e completa il Future restituito da submit. Se un invio fallisce il nonce viene riletto
+    dalla catena alla transazione successiva.
+    Se è indicato un RecordCountTracker, le ricevute confermate ne aggiornano i conteggi.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, poll_interval=RECEIPT_POLL_INTERVAL, receipt_timeout=RECEIPT_TIMEOUT, tracker=None):
+        self.max_in_flight = max_in_flight
+        self.tracker = tracker
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self._account = None
+        self._nonce = None
+        self._send_lock = threading.Lock()
+        self._in_flight = {}
+        # Posti della finestra riservati da invii in corso, e richiesta di rileggere il nonce
+        self._reserved = 0
+        self._nonce_stale = False
+        self._cond = threading.Condition()
+        self._collector = None
+
+    def account(self):
+        if self._account is None:
+            self._account = web3.eth.accounts[0]
+        return self._account
+
+    def submit(self, function, gas=None):
+        """
+        Invia una transazione senza attenderne la conferma.
+
+        Args:
+            function: La funzione del contract da chiamare, già con i suoi argomenti.
+            gas: Il gas della transazione; se None viene stimato con un margine del 20%.
+
+        Returns:
+            Un Future che restituisce la ricevuta, o solleva un'eccezione se la transazione fallisce.
+        """
+        # Il posto nella finestra viene riservato prima di prendere _send_lock, che il thread
+        # delle ricevute non deve mai attendere
+        with self._cond:
+            while len(self._in_flight) + self._reserved >= self.max_in_flight:
+                self._cond.wait()
+            self._reserved += 1
+        try:
+            with self._send_lock:
+                account = self.account()
+                with self._cond:
+                    if self._nonce_stale:
+                        self._nonce, self._nonce_stale = None, False
+                if self._nonce is None:
+                    self._nonce = web3.eth.get_transaction_count(account, 'pending')
+                try:
+                    if gas is None:
+                        gas = int(function.estimate_gas({'from': account}) * GAS_MARGIN)
+                    tx_hash = function.transact({'from': account, 'nonce': self._nonce, 'gas': gas})
+                except Exception:
+                    self._nonce = None
+                    raise
+                self._nonce += 1
+        except Exception:
+            with self._cond:
+                self._reserved -= 1
+                self._cond.notify_all()
+            raise
 
-    tx_hash = contract.functions.addRecord(operation_type, course_name, additional_info, encrypted_id).transact({
-        'from': accounts[0],
-        'gas': 500000
-    })
+        future = Future()
+        with self._cond:
+            self._reserved -= 1
+            self._in_flight[tx_hash] = (future, time.time())
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect_receipts, name="receipt-collector", daemon=True)
+                self._collector.start()
+        return future
 
-    receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+    def _resolve(self, tx_hash, receipt=None, error=None):
+        with self._cond:
+            future, _ = self._in_flight.pop(tx_hash)
+            self._cond.notify_all()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(receipt)
+
+    def _collect_receipts(self):
+        while True:
+            with self._cond:
+                if not self._in_flight:
+                    self._collector = None
+                    return
+                pending = list(self._in_flight.items())
+            for tx_hash, (_, sent_at) in pending:
+                try:
+                    receipt = web3.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    if time.time() - sent_at > self.receipt_timeout:
+                        # La transazione potrebbe non essere mai stata minata: il nonce viene riletto al prossimo invio
+                        with self._cond:
+                            self._nonce_stale = True
+                        self._resolve(tx_hash, error=TimeoutError(f"Ricevuta di {Web3.to_hex(tx_hash)} non ricevuta"))
+                    continue
+                except Exception as e:
+                    print(f"Errore durante la lettura della ricevuta di {Web3.to_hex(tx_hash)}: {e}")
+                    continue
+                if receipt['status'] == 0:
+                    self._resolve(tx_hash, error=RuntimeError(f"Transazione {Web3.to_hex(tx_hash)} annullata"))
+                else:
+                    if self.tracker is not None:
+                        try:
+                            self.tracker.add_receipt(receipt)
+                        except Exception as e:
+                            print(f"Errore durante il conteggio dei record di {Web3.to_hex(tx_hash)}: {e}")
+                    self._resolve(tx_hash, receipt=receipt)
+            time.sleep(self.poll_interval)
+
+    def gas_budget(self):
+        """Restituisce il gas massimo di una transazione, margine compreso, secondo il limite dell'ultimo blocco."""
+        return int(web3.eth.get_block('latest')['gasLimit'] * BLOCK_GAS_SHARE)
+
+    def _next_batch(self, records, start, size, budget):
+        """
+        Trova il gruppo più grande di al massimo 'size' record a partire da 'start' il cui gas
+        stimato, con il margine, rientra in budget.
+
+        Il gruppo viene ridotto in proporzione al gas stimato, o dimezzato se la stima fallisce
+        (es. perché supera il limite del blocco), fino a un solo record.
+
+        Returns:
+            Tuple (funzione addRecords, numero di record, gas della transazione).
+        """
+        size = min(size, len(records) - start)
+        while True:
+            function = contract.functions.addRecords([tuple(record) for record in records[start:start + size]])
+            try:
+                gas = int(function.estimate_gas({'from': self.account()}) * GAS_MARGIN)
+            except Exception:
+                if size == 1:
+                    raise
+                size //= 2
+                continue
+            if gas <= budget:
+                return function, size, gas
+            if size == 1:
+                raise RuntimeError(f"Il record richiede {gas} gas, oltre il limite di {budget}")
+            size = max(1, min(size // 2, size * budget // gas))
+
+    def add_records(self, records, max_batch_size=RECORDS_BATCH_MAX_SIZE):
+        """
+        Invia i record con transazioni addRecords di al massimo max_batch_size elementi, ridotte
+        se necessario perché il gas di ciascuna rientri nel limite del blocco.
+
+        Se l'invio di una transazione fallisce, le successive non vengono inviate e i record
+        rimanenti ricevono un unico Future con lo stesso errore, così che restino nell'ordine dato.
+
+        Returns:
+            La lista delle tuple (numero di record, Future della transazione), nell'ordine dato.
+        """
+        batches = []
+        start = 0
+        size = max_batch_size
+        try:
+            budget = self.gas_budget()
+            while start < len(records):
+                function, size, gas = self._next_batch(records, start, size, budget)
+                batches.append((size, self.submit(function, gas)))
+                start += size
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            batches.append((len(records) - start, future))
+        return batches
+
+
+sender = PipelinedSender()
+
+def add_record(operation_type, course_name, additional_info, encrypted_id):
+    sender.submit(contract.functions.addRecord(operation_type, course_name, additional_info, encrypted_id), ADD_RECORD_GAS).result()
     print('Record aggiunto con successo!')
 
+def add_records(records, max_batch_size=RECORDS_BATCH_MAX_SIZE):
+    """
+    Aggiunge più record con transazioni addRecords di al massimo max_batch_size elementi,
+    ridotte se necessario perché il gas di ciascuna rientri nel limite del blocco.
+    Le transazioni vengono inviate senza attendere le conferme precedenti.
+
+    Args:
+        records: Lista di tuple (operation_type, course_name, additional_info, encrypted_id).
+        max_batch_size: Numero massimo di record per transazione.
+
+    Returns:
+        La lista delle ricevute delle transazioni inviate.
+    """
+    receipts = [future.result() for _, future in sender.add_records(records, max_batch_size)]
+    print(f'{len(records)} record aggiunti con successo in {len(receipts)} transazioni!')
+    return receipts
+
+def chain_count(operation_type, course_name, additional_info=""):
+    """
+    Restituisce il numero di record di un'operazione presenti sulla catena.
+
+    Returns:
+        Il valore di countRegistrations, countLessonAttendances o countExamParticipations.
+    """
+    if operation_type == "Registrazione":
+        return contract.functions.countRegistrations(course_name).call()
+    if operation_type == "Lezione":
+        return contract.functions.countLessonAttendances(course_name, additional_info).call()
+    return contract.functions.countExamParticipations(course_name, additional_info).call()
+
 def count_registrations(course_name):
     count = contract.functions.countRegistrations(course_name).call()
     print(f'Numero di registrazioni per il corso {course_name}: {count}')
@@ -46,18 +308,16 @@ def count_exam_participations(course_name, exam_date):
     return count
 
 if __name__ == '__main__':
-    if len(sys.argv) > 5:
-        print("Uso: python sendTransaction.py <operation_type> <course_name> <additional_info> <encrypted_id>")
-    elif len(sys.argv) == 5:
-        # Aggiungere il record
-        operation_type, course_name, additional_info, encrypted_id = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4]
+    # Con --conta stampa quanti record sono stati confermati, ricavandolo dalla ricevuta
+    show_count = '--conta' in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != '--conta']
+    if len(args) != 4:
+        print("Uso: python sendTransaction.py <operation_type> <course_name> <additional_info> <encrypted_id> [--conta]")
+    else:
+        operation_type, course_name, additional_info, encrypted_id = args
+        if show_count:
+            sender.tracker = RecordCountTracker()
         add_record(operation_type, course_name, additional_info, encrypted_id)
-        if operation_type == "Registrazione":
-            course_name = sys.argv[2]
-            count_registrations(sys.argv[2])
-        elif operation_type == "Lezione":
-            course_name, lesson_name = sys.argv[2], sys.argv[3]
-            count_lesson_attendances(course_name, lesson_name)
-        elif operation_type == "Esame":
-            course_name, exame_date = sys.argv[2], sys.argv[3]
-            count_exam_participations(course_name, exame_date)
\ No newline at end of file
+        if show_count:
+            count = sender.tracker.count(operation_type, course_name, additional_info)
+            print(f'Record confermati per {operation_type} "{additional_info}" del corso {course_name}: {count}')
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from courseDatabase import course_pool
+
+
+class StudentRoster:
+    """
+    Copia in memoria della tabella 'studenti' di un corso.
+
+    Viene caricata all'avvio di una lezione o di un esame, così che ogni scansione
+    trovi lo studente con una ricerca in un dizionario invece che con una query.
+    Gli ID dei tag sono sempre salvati come stringhe, sia che arrivino dal lettore
+    RFID (interi) sia che vengano inseriti a mano.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._students = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Carica tutti gli studenti del corso.
+
+        Returns:
+            Il numero di studenti caricati.
+        """
+        # Il pool crea la tabella 'studenti' se il corso non ha ancora studenti registrati
+        with course_pool.connection(self.database) as conn:
+            rows = conn.execute("SELECT id, nome, cognome, matricola FROM studenti").fetchall()
+        with self._lock:
+            self._students = {str(row[0]): list(row[1:]) for row in rows}
+            return len(self._students)
+
+    def get(self, tag_id):
+        """Restituisce [nome, cognome, matricola] dello studente, o una lista vuota se il tag non è registrato."""
+        with self._lock:
+            return list(self._students.get(str(tag_id), []))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._students)
+
+
+class SessionAttendance:
+    """
+    Insieme dei tag già registrati in una lezione o in un esame.
+
+    L'insieme è tenuto in memoria per il controllo dei duplicati e salvato nella tabella
+    'presenze_sessione' del database del corso: se il dispositivo viene riavviato a metà
+    lezione, riaprendo la stessa sessione gli studenti già registrati non vengono contati
+    una seconda volta.
+    """
+
+    def __init__(self, database, operation_type, session_name):
+        self.database = database
+        self.operation_type = operation_type
+        self.session_name = session_name
+        self._lock = threading.Lock()
+        self.create_table()
+        self._seen = self._load()
+
+    def create_table(self):
+        """Crea la tabella delle presenze di sessione se non esiste."""
+        with course_pool.connection(self.database) as conn:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS presenze_sessione (
+                        operazione TEXT NOT NULL,
+                        sessione TEXT NOT NULL,
+                        tag_id TEXT NOT NULL,
+                        registrato_il REAL NOT NULL,
+                        PRIMARY KEY (operazione, sessione, tag_id)
+                    )
+                """)
+
+    def _load(self):
+        with course_pool.connection(self.database) as conn:
+            rows = conn.execute("SELECT tag_id FROM presenze_sessione WHERE operazione = ? AND sessione = ?",
+                                (self.operation_type, self.session_name)).fetchall()
+        return {row[0] for row in rows}
+
+    def __contains__(self, tag_id):
+        with self._lock:
+            return str(tag_id) in self._seen
+
+    def __len__(self):
+        with self._lock:
+            return len(self._seen)
+
+    def mark(self, tag_id, on_marked=None):
+        """
+        Registra il tag nella sessione.
+
+        Args:
+            tag_id: Il tag da registrare.
+            on_marked: Funzione opzionale che riceve la connessione ed è eseguita nella stessa
+                transazione della presenza (es. per accodare le sincronizzazioni nell'outbox):
+                se fallisce la presenza non viene salvata.
+
+        Returns:
+            True se il tag non era ancora stato registrato, False se è un duplicato.
+        """
+        tag_id = str(tag_id)
+        with self._lock:
+            if tag_id in self._seen:
+                return False
+            with course_pool.connection(self.database) as conn:
+                with conn:
+                    conn.execute("INSERT OR IGNORE INTO presenze_sessione (operazione, sessione, tag_id, registrato_il) VALUES (?, ?, ?, ?)",
+                                 (self.operation_type, self.session_name, tag_id, time.time()))
+                    if on_marked is not None:
+                        on_marked(conn)
+            self._seen.add(tag_id)
+            return True
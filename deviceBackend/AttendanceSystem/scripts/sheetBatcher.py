@@ -0,0 +1,43 @@
+# Soglie predefinite per l'invio dei gruppi di righe
+SHEETS_BATCH_MAX_ROWS = 50
+SHEETS_BATCH_MAX_DELAY = 2.0
+
+
+class SheetBatchWriter:
+    """
+    Scrittore a gruppi per Google Sheets.
+
+    Riceve dall'outbox i gruppi di righe accumulati secondo le soglie indicate in
+    register_batch_handler e invia con un'unica chiamata values().append le righe
+    destinate allo stesso foglio di calcolo e allo stesso range, invece di una richiesta
+    per studente.
+    """
+
+    def __init__(self, sync_engine):
+        self.sync_engine = sync_engine
+
+    def write_batch(self, payloads):
+        """
+        Invia un gruppo di righe, con una richiesta per ogni coppia (foglio di calcolo, range).
+
+        Args:
+            payloads: Lista di dizionari con 'file_name', 'folder_name' e 'data'.
+
+        Returns:
+            Lista con l'errore (o None) di ciascuna riga, nello stesso ordine dei payload.
+        """
+        groups = {}
+        for index, payload in enumerate(payloads):
+            key = (payload['folder_name'], payload['file_name'], len(payload['data']) > 4)
+            groups.setdefault(key, []).append(index)
+
+        errors = [None] * len(payloads)
+        for (folder_name, file_name, _), indexes in groups.items():
+            rows = [payloads[index]['data'] for index in indexes]
+            try:
+                if not self.sync_engine.append_rows(file_name, folder_name, rows):
+                    raise Exception(f"Foglio {file_name} non trovato nella cartella {folder_name}.")
+            except Exception as e:
+                for index in indexes:
+                    errors[index] = e
+        return errors
@@ -1,152 +1,64 @@
 import os
+import sys
 import tkinter as tk
 from tkinter import messagebox
 from PIL import Image, ImageTk
 
-import json
-import sqlite3
-import subprocess
-import sys
-from datetime import datetime
-
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, padding
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from attendanceDaemon import AttendanceDaemon, DaemonError, SCAN_ACCEPTED, start_control_server, create_reader
+from daemonClient import DaemonClient
 
-import RPi.GPIO as GPIO
-from mfrc522 import SimpleMFRC522
-import threading
+# Millisecondi tra due controlli degli esiti delle scansioni
+SCAN_RESULTS_POLL_MS = 100
 
 
 class AttendanceSystem:
-    def __init__(self):
-        self.conn = None
+    """
+    Interfaccia Tk del dispositivo, client di AttendanceDaemon.
+
+    Tutta la logica (sessioni, lettore RFID, cifratura, outbox) è nel daemon: l'interfaccia
+    avvia e termina le sessioni e mostra gli esiti delle scansioni. Se non viene indicato
+    l'indirizzo di un daemon già in esecuzione, ne avvia uno nello stesso processo insieme
+    alla sua API di controllo.
+    """
+
+    def __init__(self, daemon_url=None):
         self.course_name = ""
         self.student_id = ""
         self.student_name = ""
         self.student_surname = ""
-        self.tag_id = ""
-        self.aes_key = None
-        self.aes_iv = None
         self.lesson_number = ""
         self.exam_date = ""
-        self.students_list = []
+        # Finestra di scansione aperta, chiusa dopo la prima registrazione riuscita se è una registrazione
+        self.scanning_window = None
+        self.local_daemon = None
+        self.control_server = None
+
+        if daemon_url:
+            self.client = DaemonClient(daemon_url)
+        else:
+            self.local_daemon = AttendanceDaemon(reader=create_reader())
+            self.local_daemon.start()
+            try:
+                self.control_server = start_control_server(self.local_daemon)
+            except OSError as e:
+                print(f"API di controllo non avviata: {e}")
+            self.client = self.local_daemon
+        self.last_scan_seq = self.client.status()['last_scan_seq']
 
         self.init_gui()
 
-    def create_connection(self, database):
-        """Crea una connessione a un database SQLite specificato."""
-        self.conn = None
-        try:
-            self.conn = sqlite3.connect(database)
-            print(f"Connessione al database {database} avvenuta con successo.")
-        except sqlite3.Error as e:
-            print("Connessione al database fallita.")
-        return self.conn
-
-    def create_table(self):
-        """Crea la tabella degli studenti se non esiste già."""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS studenti (
-                    id TEXT PRIMARY KEY,
-                    nome TEXT NOT NULL,
-                    cognome TEXT NOT NULL,
-                    matricola TEXT NOT NULL
-                )
-            """)
-        except sqlite3.Error as e:
-            print(e)
-
-    def insert_student(self, id, nome, cognome, matricola):
-        """
-        Inserisce un nuovo studente nel database.
-        Controlla prima se lo studente esiste già basandosi sulla matricola.
-        """
-        try:
-            cursor = self.conn.cursor()
-            query = "SELECT * FROM studenti WHERE matricola = ?"
-            cursor.execute(query, (matricola,))
-            if cursor.fetchone():
-                print("Studente già presente nel db.")
-                return 0
-            else:
-                cursor.execute("""
-                    INSERT INTO studenti (id, nome, cognome, matricola)
-                    VALUES (?, ?, ?, ?)
-                """, (id, nome, cognome, matricola))
-                self.conn.commit()
-                print("Studente inserito con successo.")
-                return 1
-        except sqlite3.Error as e:
-            print(e)
-
-    def get_student_by_id(self, student_id):
-        """Recupera i dati dello studente dal database basandosi sull'ID."""
+    def start_session(self, operation_type, name=None):
+        """Avvia una sessione sul daemon, mostrando un avviso in caso di errore."""
         try:
-            cursor = self.conn.cursor()
-            query = "SELECT nome, cognome, matricola FROM studenti WHERE id = ?"
-            cursor.execute(query, (student_id,))
-            result = cursor.fetchone()
-            if result:
-                print(f"Dati trovati: {result}.")
-                return list(result)
-            else:
-                print(f"Nessun dato trovato per lo studente con ID {student_id}.")
-                return []
-        except sqlite3.Error as e:
-            print(f"Errore durante il recupero dello studente con ID {student_id}: {e}.")
-            return []
-
-    # Funzioni di cifratura
-
-    def generate_aes_key(self):
-        """Genera una chiave AES casuale di 32 byte evitando spazi vuoti."""
-        while True:
-            key = os.urandom(32)
-            if not any(b == 32 for b in key):  # Evita chiavi con byte di spazio (32)
-                return key
-
-    def generate_aes_iv(self):
-        """Genera un vettore di inizializzazione (IV) AES casuale di 16 byte evitando spazi vuoti."""
-        while True:
-            iv = os.urandom(16)
-            if not any(b == 32 for b in iv):
-                return iv
-
-    def encrypt_id_aes(self, id_bytes, iv, key):
-        """Cifra un ID utilizzando AES in modalità CFB."""
-        cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
-        encryptor = cipher.encryptor()
-
-        padder = padding.PKCS7(algorithms.AES.block_size).padder()
-        padded_data = padder.update(id_bytes) + padder.finalize()
-
-        ciphertext = encryptor.update(padded_data) + encryptor.finalize()
-        return ciphertext
-
-    def decrypt_id_aes(self, ciphertext, iv, key):
-        """Decifra un ID utilizzando AES in modalità CFB."""
-        cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
-        decryptor = cipher.decryptor()
-
-        padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
-
-        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-        plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
-        return plaintext
+            self.client.start_session(operation_type, self.course_name, name)
+            return True
+        except Exception as e:
+            print(f"Errore durante l'avvio della sessione: {e}")
+            messagebox.showerror("Error", f"Unable to start the session: {e}")
+            return False
 
     # Funzioni di utilità
 
-    def execute_subprocess_command(self, comando):
-        """Esegue un comando subprocess e ritorna l'output."""
-        process = subprocess.run(comando, capture_output=True, text=True)
-        if process.returncode == 0:
-            return process.stdout.strip()  # Restituisce l'output come stringa, senza spazi bianchi aggiuntivi
-        else:
-            raise Exception(f"Subprocess error: {process.stderr}")
-
     def load_image(self, path, width, height):
         """Carica un'immagine, ridimensiona e la converte in un oggetto compatibile con Tkinter."""
         if not os.path.exists(path):
@@ -178,9 +90,6 @@ class AttendanceSystem:
             messagebox.showwarning("Input Required", "Please enter the course name before proceeding.")
             return
 
-        database = f"{self.course_name}.db"
-        self.create_connection(database)
-
         if button == "Registration":
             self.show_registration_fields(True)
             self.registration_frame.pack(fill=tk.X, padx=20, pady=10)
@@ -235,31 +144,9 @@ class AttendanceSystem:
             messagebox.showwarning("Input Required", "Please fill in all fields before proceeding.")
             return
 
-        comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/createGsheet.py", "R", "Registrazione", self.course_name]
-        self.execute_subprocess_command(comando)
-
-        if self.conn is not None:
-            self.create_table()
-
-            # Genera chiave e IV e controlla se già esistono delle vecchie chiavi
-            self.aes_key = self.generate_aes_key()
-            self.aes_iv = self.generate_aes_iv()
-
-            # Salva la chiave in Google Sheets
-            comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/keyChainGsheet.py", "R", "Registrazione", self.course_name, str(self.aes_key), str(self.aes_iv)]
-            keyChainResult = self.execute_subprocess_command(comando)
-
-            # Controlla se l'output contiene i dati necessari, ovvero se già esistevano delle chiavi
-            if keyChainResult:
-                results = keyChainResult.split()
-                if len(results) >= 2:
-                    resultKey, resultIV = results[0], results[1]
-                    self.aes_key = eval(resultKey)
-                    self.aes_iv = eval(resultIV)
-                    print("La chiave e l'IV già esistono nel wallet.")
-                else:
-                    print("Nuova chiave e IV aggiunti al wallet del corso.")
-
+        if self.start_session("Registrazione"):
+            # Lo studente viene associato dal daemon al prossimo tag letto o inserito
+            self.client.register_student(self.student_name, self.student_surname, self.student_id)
             self.open_scanning_window("Scan Tag", self.submit_tag_id)
 
         # Resetta i campi di input
@@ -275,33 +162,7 @@ class AttendanceSystem:
             messagebox.showwarning("Input Required", "Please enter the lesson name before proceeding.")
             return
 
-        comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/createGsheet.py", "L", self.lesson_number, self.course_name]
-        self.execute_subprocess_command(comando)
-
-        self.students_list = []
-
-        if self.conn is not None:
-            self.create_table()
-
-            # Genera chiave e IV per la lezione
-            self.aes_key = self.generate_aes_key()
-            self.aes_iv = self.generate_aes_iv()
-
-            # Salva chiave in Google Sheets
-            comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/keyChainGsheet.py", "L", self.lesson_number, self.course_name, str(self.aes_key), str(self.aes_iv)]
-            keyChainResult = self.execute_subprocess_command(comando)
-
-            # Controlla se l'output contiene i dati necessari
-            if keyChainResult:
-                results = keyChainResult.split()
-                if len(results) >= 2:
-                    resultKey, resultIV = results[0], results[1]
-                    self.aes_key = eval(resultKey)
-                    self.aes_iv = eval(resultIV)
-                    print("La chiave e l'IV già esistono nel wallet.")
-                else:
-                    print("Nuova chiave e IV aggiunti al wallet del corso.")
-
+        if self.start_session("Lezione", self.lesson_number):
             self.open_scanning_window("Lesson Registration", self.submit_tag_id)
 
         self.lesson_number_entry.delete(0, tk.END)
@@ -314,33 +175,7 @@ class AttendanceSystem:
             messagebox.showwarning("Input Required", "Please enter the exam date before proceeding.")
             return
 
-        comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/createGsheet.py", "E", self.exam_date, self.course_name]
-        self.execute_subprocess_command(comando)
-
-        self.students_list = []
-
-        if self.conn is not None:
-            self.create_table()
-
-            # Genera chiave e IV per l'esame
-            self.aes_key = self.generate_aes_key()
-            self.aes_iv = self.generate_aes_iv()
-
-            # Salva chiave in Google Sheets
-            comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/keyChainGsheet.py", "E", self.exam_date, self.course_name, str(self.aes_key), str(self.aes_iv)]
-            keyChainResult = self.execute_subprocess_command(comando)
-
-            # Controlla se l'output contiene i dati necessari
-            if keyChainResult:
-                results = keyChainResult.split()
-                if len(results) >= 2:
-                    resultKey, resultIV = results[0], results[1]
-                    self.aes_key = eval(resultKey)
-                    self.aes_iv = eval(resultIV)
-                    print("La chiave e l'IV già esistono nel wallet.")
-                else:
-                    print("Nuova chiave e IV aggiunti al wallet del corso.")
-
+        if self.start_session("Esame", self.exam_date):
             self.open_scanning_window("Exam Registration", self.submit_tag_id)
 
         self.exam_date_entry.delete(0, tk.END)
@@ -383,140 +218,57 @@ class AttendanceSystem:
             messagebox.showwarning("Warning", "Unable to grab the window due to another active grab.")
 
         scanning_window.protocol("WM_DELETE_WINDOW", lambda: self.on_close_window(scanning_window))
+        self.scanning_window = scanning_window
+
+    def poll_scan_results(self):
+        """
+        Legge dal daemon gli esiti delle nuove scansioni, dal lettore RFID o inserite a mano.
+        Viene richiamata periodicamente dal ciclo di Tk.
+        """
+        try:
+            results = self.client.recent_scans(self.last_scan_seq)
+        except Exception as e:
+            print(f"Errore durante la lettura delle scansioni: {e}")
+            results = []
+        for result in results:
+            self.last_scan_seq = result['seq']
+            self.show_scan_result(result)
+        self.root.after(SCAN_RESULTS_POLL_MS, self.poll_scan_results)
+
+    def show_scan_result(self, result):
+        """Aggiorna l'interfaccia con l'esito di una scansione."""
+        print(f"Tag {result['tag_id']}: {result['message']}")
+        if result['operation'] == "Registrazione":
+            self.show_success_message(result['status'] == SCAN_ACCEPTED)
+            if self.scanning_window is not None and self.scanning_window.winfo_exists():
+                self.scanning_window.destroy()
+            self.scanning_window = None
 
     def submit_tag_id(self, tag_id, window, entry):
-        """Gestisce l'invio dell'ID del tag durante la scansione."""
-        GPIO.setwarnings(False)
-        reader = SimpleMFRC522()
-
-        if window.title() == "Scan Tag":
-            # Gestione della scansione per la registrazione degli studenti
-            if entry.get() == "":
-                try:
-                    self.tag_id = reader.read()[0]
-                    entry.delete(0, tk.END)
-                    entry.insert(0, str(self.tag_id))
-                except Exception as e:
-                    print(f"Errore lettura tag: {e}")
-            else:
-                self.tag_id = entry.get()
-            
-            entry.delete(0, tk.END)
-            print(f"Tag letto: {self.tag_id}")
-            
-            result = self.insert_student(self.tag_id, self.student_name, self.student_surname, self.student_id)
-            if result:
-                # Per ogni studente registrato ed inserito nel db, aggiornare il file di registrazione 
-                comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/updateGsheet.py", "Registrazione", self.course_name, "'" + str(self.tag_id), self.student_name, self.student_surname, "'" + str(self.student_id)]
-                self.execute_subprocess_command(comando)  
-
-                # Cifra l'ID con k e iv
-                id_cifrato = self.encrypt_id_aes(str(self.tag_id).encode(), self.aes_iv, self.aes_key)
-                print("ID_Cifrato: ", id_cifrato)
-
-                id_decifrato = self.decrypt_id_aes(id_cifrato, self.aes_iv, self.aes_key)
-                print("ID_De_Cifrato: ", id_decifrato)
-                                
-                # Salva su blockchain tipo_operazione, nome_corso, id_cifrato
-                comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/sendTransaction.py", "Registrazione", self.course_name, " ", str(id_cifrato)]
-                self.execute_subprocess_command(comando)
-
-                self.show_success_message(True)
-            else:
-                self.show_success_message(False)
-            
-            window.destroy()
-            
-        elif window.title() == "Lesson Registration":
-            # Gestione della scansione per la registrazione delle lezioni
-            if entry.get() == "":
-                try:
-                    self.tag_id = reader.read()[0]
-                    entry.delete(0, tk.END)
-                    entry.insert(0, str(self.tag_id))
-                except Exception as e:
-                    print(f"Errore lettura tag: {e}")
-            else:
-                self.tag_id = entry.get()
-            
-            entry.delete(0, tk.END)
-            print(f"Tag letto: {self.tag_id}")
-            
-            if self.tag_id not in self.students_list:
-                self.students_list.append(self.tag_id)
-
-                info_studente = self.get_student_by_id(self.tag_id)
-                if not info_studente:
-                    print("Studente non trovato.")
-                else:
-                    orario = datetime.now().strftime("%H:%M:%S")
-
-                    # Per ogni studente registrato ed inserito nel db, aggiornare il file Lezione_#  
-                    comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/updateGsheet.py", self.lesson_number, self.course_name, "'" + str(self.tag_id), info_studente[0], info_studente[1], "'" + str(info_studente[2]), "'" + orario ]
-                    self.execute_subprocess_command(comando)  
-
-                    # Cifra l'ID con k e iv
-                    id_cifrato = self.encrypt_id_aes(str(self.tag_id).encode(), self.aes_iv, self.aes_key)
-                    print("ID_Cifrato: ", id_cifrato)
-
-                    id_decifrato = self.decrypt_id_aes(id_cifrato, self.aes_iv, self.aes_key)
-                    print("ID_De_Cifrato: ", id_decifrato)
-        
-                    # Salva su blockchain tipo_operazione, nome_corso, id_cifrato
-                    comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/sendTransaction.py", "Lezione", self.course_name, self.lesson_number, str(id_cifrato)]
-                    self.execute_subprocess_command(comando)
-            else:
-                print("Studente gia' registrato a lezione.")
-        
-        elif window.title() == "Exam Registration":
-            # Gestione della scansione per la registrazione degli esami
-            if entry.get() == "":
-                try:
-                    self.tag_id = reader.read()[0]
-                    entry.delete(0, tk.END)
-                    entry.insert(0, str(self.tag_id))
-                except Exception as e:
-                    print(f"Errore lettura tag: {e}")
-            else:
-                self.tag_id = entry.get()
-            
-            entry.delete(0, tk.END)
-            print(f"Tag letto: {self.tag_id}")
-            
-            if self.tag_id not in self.students_list:
-                self.students_list.append(self.tag_id)
-
-                info_studente = self.get_student_by_id(self.tag_id)
-                if not info_studente:
-                    print("Studente non trovato.")
-                else:
-                    voto = " "
-
-                    # Per ogni studente registrato ed inserito nel db, aggiornare il file giorno/mese/anno  
-                    comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/updateGsheet.py", self.exam_date, self.course_name, "'" + str(self.tag_id), info_studente[0], info_studente[1], "'" + str(info_studente[2]), voto]
-                    self.execute_subprocess_command(comando)  
-
-                    # Cifra l'ID con k e iv
-                    id_cifrato = self.encrypt_id_aes(str(self.tag_id).encode(), self.aes_iv, self.aes_key)
-                    print("ID_Cifrato: ", id_cifrato)
-
-                    id_decifrato = self.decrypt_id_aes(id_cifrato, self.aes_iv, self.aes_key)
-                    print("ID_De_Cifrato: ", id_decifrato)
-             
-                    # Salva su blockchain tipo_operazione, nome_corso, id_cifrato
-                    comando = [sys.executable, "/home/charpi/Desktop/IOT_Project/AttendanceSystemPI/AttendanceSystem/scripts/sendTransaction.py", "Esame", self.course_name, self.exam_date, str(id_cifrato)]
-                    self.execute_subprocess_command(comando)
-            else:
-                print("Studente gia' registrato per l'esame.")
+        """Invia al daemon un tag ID inserito manualmente."""
+        tag_id = str(tag_id).strip()
+        entry.delete(0, tk.END)
+        if not tag_id:
+            print("Nessun tag letto: avvicinare il tag al lettore o inserire l'ID.")
+            return
+        try:
+            # L'esito viene mostrato da poll_scan_results, come per i tag letti dal lettore
+            self.client.scan(tag_id)
+        except DaemonError as e:
+            print(f"Tag {tag_id} non accettato: {e}")
 
     def end_registration(self, window):
         """Termina la registrazione e chiude la finestra attuale."""
         print("Registrazione Terminata.")
+        self.client.end_session()
+        self.scanning_window = None
         window.destroy()
 
     def on_close_window(self, window):
         """Gestisce la chiusura della finestra con conferma da parte dell'utente."""
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
+            self.client.end_session()
+            self.scanning_window = None
             window.destroy()
 
     def show_success_message(self, success):
@@ -607,15 +359,16 @@ class AttendanceSystem:
         self.show_lesson_fields(False)
         self.show_exam_fields(False)
 
+        # Controlla periodicamente gli esiti delle scansioni
+        self.root.after(SCAN_RESULTS_POLL_MS, self.poll_scan_results)
+
         # Avvia l'interfaccia utente principale di Tkinter
         self.root.mainloop()
+        if self.control_server is not None:
+            self.control_server.shutdown()
+        if self.local_daemon is not None:
+            self.local_daemon.stop()
 
-# Avvia l'applicazione
+# Avvia l'applicazione; con un indirizzo (es. http://127.0.0.1:8765) si collega a un daemon già in esecuzione
 if __name__ == "__main__":
-    AttendanceSystem()
-
-
-
-
-
-
+    AttendanceSystem(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,154 @@
+import functools
+import threading
+
+import createGsheet
+import keyChainGsheet
+import updateGsheet
+import sendTransaction
+from outbox import TARGET_SHEETS, TARGET_BLOCKCHAIN
+from sheetBatcher import SheetBatchWriter, SHEETS_BATCH_MAX_ROWS, SHEETS_BATCH_MAX_DELAY
+
+
+class SyncEngine:
+    """
+    Motore di sincronizzazione in-process verso Google Sheets e blockchain.
+
+    Mantiene aperti per tutta la vita del processo i servizi autenticati di Google Drive
+    e Google Sheets e la connessione a Ganache, così che ogni scansione non debba
+    avviare un nuovo interprete né ripetere autenticazione e connessione.
+    I client di googleapiclient non sono thread-safe: ogni thread riceve i propri servizi,
+    così che thread diversi (es. l'avvio di una sessione e l'outbox) possano chiamare
+    Google in parallelo.
+    Gli script createGsheet, keyChainGsheet, updateGsheet e sendTransaction restano
+    utilizzabili da riga di comando come semplici wrapper delle stesse funzioni.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        # L'autenticazione può riscrivere token.pickle: viene eseguita da un thread alla volta
+        self._auth_lock = threading.Lock()
+
+    def google_services(self):
+        """Restituisce i servizi Google autenticati del thread corrente, creandoli alla prima richiesta."""
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            with self._auth_lock:
+                services = createGsheet.authenticate_google_services()
+            self._local.services = services
+        return services
+
+    def create_sheet(self, sheet_type, file_name, folder_name):
+        """
+        Crea, se non esiste già, il foglio di calcolo di un'operazione.
+
+        Args:
+            sheet_type: Il tipo di foglio ('R' per Registrazione, 'L' per Lezione, 'E' per Esame).
+            file_name: Il nome del foglio di calcolo.
+            folder_name: Il nome della cartella del corso.
+        """
+        drive_service, sheets_service = self.google_services()
+        createGsheet.create_sheet(drive_service, sheets_service, sheet_type, file_name, folder_name)
+
+    def load_keys(self, folder_name):
+        """Restituisce tutte le chiavi del foglio ChiaviCorso di un corso: {operazione: (chiave, IV)}."""
+        drive_service, sheets_service = self.google_services()
+        return keyChainGsheet.get_course_keys(drive_service, sheets_service, folder_name)
+
+    def store_keys(self, folder_name, keys):
+        """
+        Aggiunge al foglio ChiaviCorso le chiavi ({operazione: (chiave, IV)}) delle operazioni che non ne hanno.
+
+        Returns:
+            Tutte le chiavi del corso dopo il salvataggio.
+        """
+        drive_service, sheets_service = self.google_services()
+        return keyChainGsheet.store_keys(drive_service, sheets_service, folder_name, keys)
+
+    def update_sheet(self, file_name, folder_name, data):
+        """
+        Aggiunge una riga di dati al foglio di calcolo di un'operazione.
+
+        Args:
+            file_name: Il nome del foglio di calcolo.
+            folder_name: Il nome della cartella del corso.
+            data: La lista di dati da aggiungere.
+
+        Returns:
+            True se i dati sono stati aggiunti, False se il foglio non è stato trovato.
+        """
+        drive_service, sheets_service = self.google_services()
+        return updateGsheet.update_sheet(drive_service, sheets_service, file_name, folder_name, data)
+
+    def append_rows(self, file_name, folder_name, rows):
+        """
+        Aggiunge più righe al foglio di calcolo di un'operazione con un'unica richiesta.
+
+        Args:
+            file_name: Il nome del foglio di calcolo.
+            folder_name: Il nome della cartella del corso.
+            rows: La lista delle righe da aggiungere; devono avere tutte lo stesso numero di colonne.
+
+        Returns:
+            True se i dati sono stati aggiunti, False se il foglio non è stato trovato.
+        """
+        drive_service, sheets_service = self.google_services()
+        return updateGsheet.append_rows_by_name(drive_service, sheets_service, file_name, folder_name, rows)
+
+    def submit_records(self, records, max_batch_size=sendTransaction.RECORDS_BATCH_MAX_SIZE):
+        """
+        Invia più record allo smart contract senza attendere le conferme.
+
+        Returns:
+            La lista delle tuple (numero di record, Future della transazione), nell'ordine dato.
+        """
+        return sendTransaction.sender.add_records(records, max_batch_size)
+
+    def track_record_counts(self):
+        """Attiva, se non lo è già, il conteggio dei record confermati dalle ricevute delle transazioni."""
+        if sendTransaction.sender.tracker is None:
+            sendTransaction.sender.tracker = sendTransaction.RecordCountTracker()
+        return sendTransaction.sender.tracker
+
+    def seed_record_count(self, operation_type, course_name, additional_info=""):
+        """
+        Allinea il conteggio dei record confermati di un'operazione al totale presente sulla
+        catena, così che confirmed_count comprenda anche i record inviati prima dell'avvio.
+        """
+        count = sendTransaction.chain_count(operation_type, course_name, additional_info)
+        self.track_record_counts().seed(operation_type, course_name, additional_info, count)
+        return count
+
+    def confirmed_count(self, operation_type, course_name, additional_info=""):
+        """
+        Restituisce quanti record di un'operazione sono stati confermati sulla blockchain
+        secondo il totale letto con seed_record_count e le ricevute successive.
+        """
+        tracker = sendTransaction.sender.tracker
+        return tracker.count(operation_type, course_name, additional_info) if tracker is not None else None
+
+    def register_outbox_handlers(self, outbox, sheets_max_rows=SHEETS_BATCH_MAX_ROWS, sheets_max_delay=SHEETS_BATCH_MAX_DELAY,
+                                 records_max_batch_size=sendTransaction.RECORDS_BATCH_MAX_SIZE, records_max_delay=sendTransaction.RECORDS_BATCH_MAX_DELAY):
+        """
+        Collega l'outbox di un corso ai metodi di invio del motore.
+
+        Le righe per Google Sheets e i record per la blockchain vengono inviati a gruppi
+        secondo le soglie indicate.
+        """
+        sheet_writer = SheetBatchWriter(self)
+        outbox.register_batch_handler(TARGET_SHEETS, sheet_writer.write_batch, sheets_max_rows, sheets_max_delay)
+        # Ogni consegna dell'outbox invia fino a MAX_IN_FLIGHT transazioni senza attendere le conferme
+        outbox.register_batch_handler(TARGET_BLOCKCHAIN, functools.partial(self._deliver_records, max_batch_size=records_max_batch_size),
+                                      records_max_batch_size * sendTransaction.MAX_IN_FLIGHT, records_max_delay)
+
+    def _deliver_records(self, payloads, max_batch_size=sendTransaction.RECORDS_BATCH_MAX_SIZE):
+        records = [(payload['operation_type'], payload['course_name'], payload['additional_info'], payload['encrypted_id'])
+                   for payload in payloads]
+        errors = []
+        for count, future in self.submit_records(records, max_batch_size):
+            try:
+                future.result()
+                error = None
+            except Exception as e:
+                error = str(e)
+            errors.extend([error] * count)
+        return errors if any(errors) else None
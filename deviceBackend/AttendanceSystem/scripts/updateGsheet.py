@@ -3,6 +3,7 @@ import os
 import pickle
 from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
+from driveCache import drive_cache, retry_on_not_found
 
 # Definizione degli ambiti di accesso per i servizi Google
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
@@ -66,6 +67,30 @@ def find_sheet_id_by_name(drive_service, folder_name, sheet_name, parent_folder_
     """
     Trova l'ID di un foglio di calcolo Google Sheets in una cartella specificata, cercando ricorsivamente nelle sottocartelle.
 
+    Args:
+        drive_service: Il servizio autenticato di Google Drive.
+        folder_name: Il nome della cartella principale.
+        sheet_name: Il nome del foglio di calcolo da cercare.
+        parent_folder_id: (Opzionale) L'ID della cartella principale in cui cercare.
+
+    Returns:
+        sheet_id: L'ID del foglio di calcolo trovato o None se non trovato.
+    """
+    if parent_folder_id is None:
+        # Un foglio già risolto in precedenza non richiede chiamate a Drive
+        cached_id = drive_cache.get('resolved', folder_name, sheet_name)
+        if cached_id:
+            return cached_id
+        sheet_id = find_sheet_id_in_drive(drive_service, folder_name, sheet_name)
+        if sheet_id:
+            drive_cache.set(sheet_id, 'resolved', folder_name, sheet_name)
+        return sheet_id
+    return find_sheet_id_in_drive(drive_service, folder_name, sheet_name, parent_folder_id)
+
+def find_sheet_id_in_drive(drive_service, folder_name, sheet_name, parent_folder_id=None):
+    """
+    Cerca su Google Drive l'ID di un foglio di calcolo, senza usare la cache locale.
+
     Args:
         drive_service: Il servizio autenticato di Google Drive.
         folder_name: Il nome della cartella principale.
@@ -123,6 +148,79 @@ def append_data_to_sheet(sheets_service, sheet_id, data, range_name):
     response = request.execute()
     print(f"Dati aggiunti con successo al foglio. ID riga: {response.get('updates').get('updatedRange')}")
 
+def append_rows_to_sheet(sheets_service, sheet_id, rows, range_name):
+    """
+    Aggiunge più righe di dati a un foglio di calcolo con un'unica richiesta.
+
+    Args:
+        sheets_service: Il servizio autenticato di Google Sheets.
+        sheet_id: L'ID del foglio di calcolo a cui aggiungere i dati.
+        rows: La lista delle righe da aggiungere, ognuna una lista di valori.
+        range_name: Il range nel foglio di calcolo dove aggiungere i dati.
+
+    Returns:
+        None
+    """
+    value_range_body = {"values": rows}
+    response = sheets_service.spreadsheets().values().append(
+        spreadsheetId=sheet_id, range=range_name,
+        valueInputOption='USER_ENTERED', insertDataOption='INSERT_ROWS',
+        body=value_range_body).execute()
+    print(f"{len(rows)} righe aggiunte con successo al foglio. Range: {response.get('updates').get('updatedRange')}")
+
+@retry_on_not_found
+def append_rows_by_name(drive_service, sheets_service, file_name, folder_name, rows):
+    """
+    Trova il foglio di calcolo di un'operazione e vi aggiunge più righe con un'unica richiesta.
+
+    Args:
+        drive_service: Il servizio autenticato di Google Drive.
+        sheets_service: Il servizio autenticato di Google Sheets.
+        file_name: Il nome del foglio di calcolo.
+        folder_name: Il nome della cartella del corso.
+        rows: La lista delle righe da aggiungere; devono avere tutte lo stesso numero di colonne.
+
+    Returns:
+        True se i dati sono stati aggiunti, False se il foglio non è stato trovato.
+    """
+    sheet_id = find_sheet_id_by_name(drive_service, folder_name, file_name)
+    if not sheet_id:
+        print("Foglio non trovato.")
+        return False
+    append_rows_to_sheet(sheets_service, sheet_id, rows, range_for_data(rows[0]))
+    return True
+
+def range_for_data(data):
+    """
+    Restituisce il range da usare per una riga di dati.
+
+    Le righe di registrazione hanno 4 colonne, quelle di lezione ed esame ne hanno 5
+    (orario di arrivo o voto).
+    """
+    return 'A:F' if len(data) > 4 else 'A:E'
+
+@retry_on_not_found
+def update_sheet(drive_service, sheets_service, file_name, folder_name, data):
+    """
+    Trova il foglio di calcolo di un'operazione e vi aggiunge una riga di dati.
+
+    Args:
+        drive_service: Il servizio autenticato di Google Drive.
+        sheets_service: Il servizio autenticato di Google Sheets.
+        file_name: Il nome del foglio di calcolo (es. 'Registrazione', nome della lezione o data dell'esame).
+        folder_name: Il nome della cartella del corso.
+        data: La lista di dati da aggiungere al foglio di calcolo.
+
+    Returns:
+        True se i dati sono stati aggiunti, False se il foglio non è stato trovato.
+    """
+    sheet_id = find_sheet_id_by_name(drive_service, folder_name, file_name)
+    if not sheet_id:
+        print("Foglio non trovato.")
+        return False
+    append_data_to_sheet(sheets_service, sheet_id, data, range_for_data(data))
+    return True
+
 if __name__ == "__main__":
     # Controlla il numero di argomenti passati dalla riga di comando
     argc = len(sys.argv)
@@ -132,17 +230,12 @@ if __name__ == "__main__":
     else:
         file_name, folder_name, student_id, first_name, last_name, matriculation_number = sys.argv[1:7]
         orario_arrivo = sys.argv[7] if argc == 8 else None
-        range_name = 'A:F' if orario_arrivo else 'A:E'
 
-        # Autentica i servizi Google e trova l'ID del foglio di calcolo
+        # Prepara i dati da aggiungere al foglio di calcolo
+        data = [student_id, first_name, last_name, matriculation_number]
+        if orario_arrivo:
+            data.append(orario_arrivo)
+
+        # Autentica i servizi Google e aggiunge i dati al foglio di calcolo
         drive_service, sheets_service = authenticate_google_services()
-        sheet_id = find_sheet_id_by_name(drive_service, folder_name, file_name)
-        if sheet_id:
-            # Prepara i dati da aggiungere al foglio di calcolo
-            data = [student_id, first_name, last_name, matriculation_number]
-            if orario_arrivo:
-                data.append(orario_arrivo)
-            # Aggiunge i dati al foglio di calcolo
-            append_data_to_sheet(sheets_service, sheet_id, data, range_name)
-        else:
-            print("Foglio non trovato.")
+        update_sheet(drive_service, sheets_service, file_name, folder_name, data)
@@ -2,7 +2,10 @@ import os
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from models import db
+from models import db, init_db
+from indexer import RecordIndexer
+from keyService import KeyService
+from keyStore import LocalKeyStore
 import logging
 from logging.handlers import RotatingFileHandler
 
@@ -21,6 +24,12 @@ def create_app():
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = 3600
     app.config['JWT_SECRET_KEY'] = os.urandom(24).hex()
     app.config['SECRET_KEY'] = os.urandom(24).hex()
+    app.config['INDEXER_DATABASE'] = 'records_index.db'
+    app.config['KEY_STORE_DATABASE'] = 'keychain.db'
+    # Se False l'indicizzatore va avviato a parte con 'python indexer.py'
+    app.config['INDEXER_IN_PROCESS'] = True
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = 1024
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = 8 * 1024 * 1024
 
     db.init_app(app)
     jwt = JWTManager(app)
@@ -31,6 +40,24 @@ def create_app():
     handler.setLevel(logging.INFO)
     app.logger.addHandler(handler)
 
+    # Lo schema viene preparato una sola volta all'avvio e non a ogni richiesta
+    with app.app_context():
+        init_db()
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Crea lo schema del database e l'utente amministratore."""
+        init_db()
+
+    record_indexer = RecordIndexer(app.config['INDEXER_DATABASE'])
+    if app.config['INDEXER_IN_PROCESS']:
+        record_indexer.start()
+    app.extensions['record_indexer'] = record_indexer
+
+    key_service = KeyService(store=LocalKeyStore(app.config['KEY_STORE_DATABASE']))
+    key_service.start()
+    app.extensions['key_service'] = key_service
+
     from routes import configure_routes
     configure_routes(app)
 
@@ -0,0 +1,61 @@
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+BLOCK_SIZE = 16
+
+
+def unpad_pkcs7(data):
+    """Rimuove il padding PKCS7 controllandone la validità."""
+    pad = data[-1] if data else 0
+    if pad < 1 or pad > BLOCK_SIZE or data[-pad:] != bytes([pad]) * pad:
+        raise ValueError('invalid padding')
+    return data[:-pad]
+
+
+def xor_bytes(a, b):
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+
+class BatchDecryptor:
+    """
+    Decifratura a blocchi degli ID cifrati con AES-CFB e padding PKCS7.
+
+    In CFB ogni blocco in chiaro è P_i = C_i XOR AES_k(C_{i-1}), con C_0 = IV. Tutti i
+    record di un'operazione condividono chiave e IV, quindi il keystream di un intero
+    gruppo di record si ottiene con un'unica chiamata AES in modalità ECB sui blocchi
+    (IV, C_1, ..., C_{n-1}) di tutti i record, riutilizzando lo stesso contesto di cifratura
+    invece di crearne uno nuovo per ogni record. Un record non valido non interrompe la
+    decifratura degli altri.
+    """
+
+    def decrypt(self, ciphertexts, key, iv):
+        """
+        Decifra una lista di ID cifrati con la stessa chiave e lo stesso IV.
+
+        Returns:
+            Una lista, nello stesso ordine, di tuple (testo in chiaro, None) oppure (None, errore).
+        """
+        results = [None] * len(ciphertexts)
+        feedback = []
+        valid = []
+        for position, ciphertext in enumerate(ciphertexts):
+            if not isinstance(ciphertext, bytes) or not ciphertext or len(ciphertext) % BLOCK_SIZE:
+                results[position] = (None, 'invalid ciphertext length')
+                continue
+            feedback.append(iv)
+            feedback.append(ciphertext[:-BLOCK_SIZE])
+            valid.append(position)
+
+        if valid:
+            encryptor = Cipher(algorithms.AES(key), modes.ECB(), backend=default_backend()).encryptor()
+            keystream = encryptor.update(b''.join(feedback)) + encryptor.finalize()
+            offset = 0
+            for position in valid:
+                ciphertext = ciphertexts[position]
+                block = keystream[offset:offset + len(ciphertext)]
+                offset += len(ciphertext)
+                try:
+                    results[position] = (unpad_pkcs7(xor_bytes(ciphertext, block)), None)
+                except ValueError as e:
+                    results[position] = (None, str(e))
+        return results
@@ -83,6 +83,23 @@ def check_existing_key(sheets_service, sheet_id, operation_name):
         print(f"Error checking existing key: {e}")
     return None, None  # Return None if not found
 
+def load_course_keys(sheets_service, sheet_id):
+    # Scarica in una sola richiesta tutte le chiavi del corso: {operazione: (chiave, IV)}
+    result = sheets_service.spreadsheets().values().get(spreadsheetId=sheet_id, range='A:C').execute()
+    keys = {}
+    for row in result.get('values', [])[1:]:
+        if len(row) >= 3 and row[0] not in keys:
+            keys[row[0]] = (row[1], row[2])
+    return keys
+
+def key_name_for_operation(operazione, infoAgg):
+    # Le registrazioni usano un'unica chiave per corso, lezioni ed esami una chiave ciascuno
+    if operazione == "Registrazione":
+        return operazione
+    elif operazione == "Lezione" or operazione == "Esame":
+        return infoAgg
+    return None
+
 
 if __name__ == "__main__":
     if len(sys.argv) != 4:
@@ -0,0 +1,236 @@
+import sqlite3
+import threading
+import time
+import logging
+from web3 import Web3
+from blockchain import web3, contract
+
+INDEXER_DATABASE = 'records_index.db'
+# Secondi di attesa tra due controlli di nuovi blocchi
+INDEXER_POLL_INTERVAL = 2.0
+# Numero massimo di blocchi letti con una singola chiamata eth_getLogs
+INDEXER_BLOCK_BATCH = 1000
+
+RECORD_CREATED_TOPIC = Web3.to_hex(Web3.keccak(text="RecordCreated(string,string,string,string)"))
+
+
+class RecordIndexer:
+    """
+    Indicizzatore off-chain degli eventi RecordCreated.
+
+    Legge i log del contract da Ganache e li salva in un database SQLite locale con
+    indici per (tipo di operazione, corso, informazioni aggiuntive), così che conteggi
+    e ricerche non richiedano una chiamata al contract. L'ultimo blocco indicizzato
+    viene salvato nello stesso database e l'indicizzazione riprende da lì dopo un riavvio.
+    """
+
+    def __init__(self, database=INDEXER_DATABASE, poll_interval=INDEXER_POLL_INTERVAL, block_batch=INDEXER_BLOCK_BATCH):
+        self.database = database
+        self.poll_interval = poll_interval
+        self.block_batch = block_batch
+        self.last_sync_at = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.create_tables()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def create_tables(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS records (
+                        block_number INTEGER NOT NULL,
+                        log_index INTEGER NOT NULL,
+                        transaction_hash TEXT NOT NULL,
+                        operation_type TEXT NOT NULL,
+                        course_name TEXT NOT NULL,
+                        additional_info TEXT NOT NULL,
+                        encrypted_id TEXT NOT NULL,
+                        PRIMARY KEY (block_number, log_index)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_records_operation ON records (operation_type, course_name, additional_info)")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS checkpoint (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        contract_address TEXT NOT NULL,
+                        last_block INTEGER NOT NULL
+                    )
+                """)
+                row = conn.execute("SELECT contract_address FROM checkpoint WHERE id = 1").fetchone()
+                if row is None or row[0] != contract.address:
+                    # Nuovo contract: l'indice precedente non è più valido
+                    conn.execute("DELETE FROM records")
+                    conn.execute("INSERT OR REPLACE INTO checkpoint (id, contract_address, last_block) VALUES (1, ?, -1)",
+                                 (contract.address,))
+        finally:
+            conn.close()
+
+    def last_indexed_block(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT last_block FROM checkpoint WHERE id = 1").fetchone()[0]
+        finally:
+            conn.close()
+
+    def sync_once(self):
+        """Indicizza i blocchi successivi al checkpoint fino all'ultimo blocco della catena."""
+        latest_block = web3.eth.block_number
+        from_block = self.last_indexed_block() + 1
+        indexed = 0
+        conn = self._connect()
+        try:
+            while from_block <= latest_block:
+                to_block = min(from_block + self.block_batch - 1, latest_block)
+                logs = web3.eth.get_logs({
+                    'address': contract.address,
+                    'fromBlock': from_block,
+                    'toBlock': to_block,
+                    'topics': [RECORD_CREATED_TOPIC]
+                })
+                rows = []
+                for log in logs:
+                    args = contract.events.RecordCreated().process_log(log)['args']
+                    rows.append((log['blockNumber'], log['logIndex'], Web3.to_hex(log['transactionHash']),
+                                 args['operationType'], args['courseName'], args['additionalInfo'], args['encryptedId']))
+                # Record e checkpoint vengono salvati nella stessa transazione
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                    conn.execute("UPDATE checkpoint SET last_block = ? WHERE id = 1", (to_block,))
+                indexed += len(rows)
+                from_block = to_block + 1
+        finally:
+            conn.close()
+        self.last_sync_at = time.time()
+        return indexed
+
+    def run_forever(self):
+        """Indicizza i nuovi blocchi finché non viene chiamato stop()."""
+        while not self._stop_event.is_set():
+            try:
+                indexed = self.sync_once()
+                if indexed:
+                    logging.info(f'Indexed {indexed} new records')
+            except Exception as e:
+                logging.error(f"Error indexing RecordCreated events: {e}")
+            self._stop_event.wait(self.poll_interval)
+
+    def start(self):
+        """Avvia l'indicizzazione in un thread in background."""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='record-indexer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def status(self):
+        """Restituisce l'ultimo blocco indicizzato e il ritardo rispetto alla catena."""
+        last_block = self.last_indexed_block()
+        status = {
+            'last_indexed_block': last_block,
+            'last_sync_at': self.last_sync_at,
+            'seconds_since_sync': time.time() - self.last_sync_at if self.last_sync_at else None
+        }
+        try:
+            chain_block = web3.eth.block_number
+            status['chain_block'] = chain_block
+            status['lag_blocks'] = max(chain_block - last_block, 0)
+        except Exception as e:
+            logging.error(f"Error reading latest block: {e}")
+            status['chain_block'] = None
+            status['lag_blocks'] = None
+        return status
+
+    def _where(self, operation_type, course_name, additional_info):
+        # Come nel contract, registrazioni e ricerche senza informazioni aggiuntive riguardano tutto il corso
+        if not additional_info or operation_type == "Registrazione":
+            return "operation_type = ? AND course_name = ?", (operation_type, course_name)
+        return "operation_type = ? AND course_name = ? AND additional_info = ?", (operation_type, course_name, additional_info)
+
+    def count(self, operation_type, course_name, additional_info=""):
+        where, params = self._where(operation_type, course_name, additional_info)
+        conn = self._connect()
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM records WHERE {where}", params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def count_many(self, queries, chunk_size=200):
+        """
+        Conta i record di più ricerche (operation_type, course_name, additional_info)
+        con una query per ogni gruppo di chunk_size ricerche.
+
+        Returns:
+            La lista dei conteggi, nello stesso ordine delle ricerche.
+        """
+        counts = [0] * len(queries)
+        conn = self._connect()
+        try:
+            for start in range(0, len(queries), chunk_size):
+                chunk = queries[start:start + chunk_size]
+                params = []
+                for index, (operation_type, course_name, additional_info) in enumerate(chunk, start):
+                    whole_course = 1 if not additional_info or operation_type == "Registrazione" else 0
+                    params.extend([index, operation_type, course_name, additional_info or "", whole_course])
+                values = ", ".join(["(?, ?, ?, ?, ?)"] * len(chunk))
+                rows = conn.execute(f"""
+                    WITH q(idx, operation_type, course_name, additional_info, whole_course) AS (VALUES {values})
+                    SELECT q.idx, COUNT(r.block_number) FROM q
+                    LEFT JOIN records r ON r.operation_type = q.operation_type AND r.course_name = q.course_name
+                        AND (q.whole_course = 1 OR r.additional_info = q.additional_info)
+                    GROUP BY q.idx
+                """, params).fetchall()
+                for index, count in rows:
+                    counts[index] = count
+        finally:
+            conn.close()
+        return counts
+
+    def get_records(self, operation_type, course_name, additional_info="", offset=0, limit=None):
+        """
+        Restituisce i record indicizzati nell'ordine della catena, come tuple
+        (operationType, courseName, additionalInfo, encryptedId).
+        """
+        where, params = self._where(operation_type, course_name, additional_info)
+        query = f"""
+            SELECT operation_type, course_name, additional_info, encrypted_id FROM records
+            WHERE {where} ORDER BY block_number, log_index LIMIT ? OFFSET ?
+        """
+        conn = self._connect()
+        try:
+            return conn.execute(query, params + (limit if limit is not None else -1, offset)).fetchall()
+        finally:
+            conn.close()
+
+    def iter_records(self, operation_type, course_name, additional_info=""):
+        """
+        Restituisce i record indicizzati uno alla volta, senza caricarli tutti in memoria.
+        La connessione resta aperta finché il generatore non viene esaurito o chiuso.
+        """
+        where, params = self._where(operation_type, course_name, additional_info)
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"""
+                SELECT operation_type, course_name, additional_info, encrypted_id FROM records
+                WHERE {where} ORDER BY block_number, log_index
+            """, params)
+            for row in cursor:
+                yield row
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    # Esegue l'indicizzatore come processo separato dall'API
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    RecordIndexer().run_forever()
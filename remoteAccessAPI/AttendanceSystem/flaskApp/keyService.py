@@ -0,0 +1,100 @@
+import threading
+import time
+import logging
+import getKIV
+from keyStore import LocalKeyStore, SheetsKeyStore
+
+# Secondi dopo i quali un corso non consultato smette di essere aggiornato in background
+KEY_CACHE_TTL = 300
+# Secondi tra due aggiornamenti in background delle chiavi dei corsi in uso
+KEY_REFRESH_INTERVAL = 60
+# Secondi minimi tra due download dello stesso corso quando una chiave non viene trovata
+KEY_MISS_REFRESH_INTERVAL = 5
+
+
+class KeyService:
+    """
+    Servizio in-process per le chiavi AES dei corsi.
+
+    Le chiavi vengono lette da un archivio locale cifrato (LocalKeyStore), con una ricerca
+    indicizzata per corso e nome della chiave. I fogli ChiaviCorso su Google Sheets sono
+    una replica: un corso viene scaricato con un'unica richiesta alla prima richiesta senza
+    chiavi locali o quando manca una chiave, e un thread in background aggiorna i corsi
+    consultati di recente. Dopo un riavvio le chiavi sono già disponibili in locale.
+    """
+
+    def __init__(self, store=None, replica=None, ttl=KEY_CACHE_TTL, refresh_interval=KEY_REFRESH_INTERVAL):
+        self.store = store or LocalKeyStore()
+        self.replica = replica or SheetsKeyStore()
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        # Corsi consultati: {corso: {'last_used': ..., 'synced_at': ...}}
+        self._courses = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def _touch(self, course_name):
+        with self._lock:
+            entry = self._courses.setdefault(course_name, {'synced_at': 0})
+            entry['last_used'] = time.time()
+            return entry['synced_at']
+
+    def _sync_course(self, course_name):
+        keys = self.replica.load_course(course_name)
+        self.store.put_many(course_name, keys)
+        with self._lock:
+            self._courses.setdefault(course_name, {'last_used': time.time()})['synced_at'] = time.time()
+        logging.info(f'Synced {len(keys)} keys for course {course_name}')
+        return keys
+
+    def get_course_keys(self, course_name):
+        """Restituisce tutte le chiavi di un corso, scaricandole se non ce ne sono in locale."""
+        synced_at = self._touch(course_name)
+        if not synced_at and not self.store.has_course(course_name):
+            return self._sync_course(course_name)
+        return self.store.load_course(course_name)
+
+    def get_key(self, operation_type, course_name, additional_info):
+        """
+        Restituisce chiave e IV (come stringhe) di un'operazione, o (None, None) se non esistono.
+        """
+        key_name = getKIV.key_name_for_operation(operation_type, additional_info)
+        if key_name is None:
+            return None, None
+        synced_at = self._touch(course_name)
+        key, iv = self.store.get(course_name, key_name)
+        # La chiave potrebbe essere stata aggiunta dopo l'ultimo download
+        if key is None and time.time() - synced_at >= KEY_MISS_REFRESH_INTERVAL:
+            key, iv = self._sync_course(course_name).get(key_name, (None, None))
+        return key, iv
+
+    def refresh(self):
+        """Copia in locale le chiavi dei corsi usati di recente e smette di aggiornare quelli inutilizzati."""
+        now = time.time()
+        with self._lock:
+            for course_name in [name for name, entry in self._courses.items() if now - entry['last_used'] > self.ttl]:
+                del self._courses[course_name]
+            courses = list(self._courses)
+        for course_name in courses:
+            try:
+                self._sync_course(course_name)
+            except Exception as e:
+                logging.error(f"Error refreshing keys for course {course_name}: {e}")
+
+    def start(self):
+        """Avvia l'aggiornamento periodico delle chiavi in un thread in background."""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='key-service', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            self.refresh()
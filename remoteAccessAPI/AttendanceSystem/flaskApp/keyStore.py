@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import getKIV
+
+KEY_STORE_DATABASE = 'keychain.db'
+KEY_STORE_MASTER_KEY_FILE = 'keychain.key'
+NONCE_SIZE = 12
+
+
+class KeyStore(ABC):
+    """
+    Interfaccia degli archivi delle chiavi dei corsi.
+
+    Ogni archivio associa alla coppia (corso, nome della chiave) una chiave e un IV, come
+    stringhe nel formato di recordCodec. Il nome della chiave è quello restituito da
+    getKIV.key_name_for_operation.
+    """
+
+    def get(self, course_name, key_name):
+        """Restituisce (chiave, IV), o (None, None) se la chiave non esiste."""
+        return self.load_course(course_name).get(key_name, (None, None))
+
+    @abstractmethod
+    def load_course(self, course_name):
+        """Restituisce tutte le chiavi di un corso: {nome della chiave: (chiave, IV)}."""
+
+
+class LocalKeyStore(KeyStore):
+    """
+    Archivio locale delle chiavi in un database SQLite, con chiave primaria (corso, nome della chiave).
+
+    Chiavi e IV vengono cifrati con AES-GCM usando una chiave del server salvata in un file
+    leggibile solo dal proprietario, così che il database da solo non riveli le chiavi.
+    """
+
+    def __init__(self, database=KEY_STORE_DATABASE, master_key_file=KEY_STORE_MASTER_KEY_FILE):
+        self.database = database
+        self._aead = AESGCM(self._load_master_key(master_key_file))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self.create_table()
+
+    @staticmethod
+    def _load_master_key(path):
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                return file.read()
+        key = AESGCM.generate_key(bit_length=256)
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as file:
+            file.write(key)
+        return key
+
+    def create_table(self):
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS course_keys (
+                    course_name TEXT NOT NULL,
+                    key_name TEXT NOT NULL,
+                    sealed_key BLOB NOT NULL,
+                    sealed_iv BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (course_name, key_name)
+                )
+            """)
+
+    def _seal(self, course_name, key_name, value):
+        # Corso e nome della chiave sono dati associati: una riga copiata su un'altra voce non si decifra
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, value.encode('utf-8'), f'{course_name}|{key_name}'.encode('utf-8'))
+
+    def _open(self, course_name, key_name, sealed):
+        return self._aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], f'{course_name}|{key_name}'.encode('utf-8')).decode('utf-8')
+
+    def get(self, course_name, key_name):
+        with self._lock:
+            row = self._conn.execute("SELECT sealed_key, sealed_iv FROM course_keys WHERE course_name = ? AND key_name = ?",
+                                     (course_name, key_name)).fetchone()
+        if row is None:
+            return None, None
+        return self._open(course_name, key_name, row[0]), self._open(course_name, key_name, row[1])
+
+    def load_course(self, course_name):
+        with self._lock:
+            rows = self._conn.execute("SELECT key_name, sealed_key, sealed_iv FROM course_keys WHERE course_name = ?",
+                                      (course_name,)).fetchall()
+        return {key_name: (self._open(course_name, key_name, sealed_key), self._open(course_name, key_name, sealed_iv))
+                for key_name, sealed_key, sealed_iv in rows}
+
+    def has_course(self, course_name):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM course_keys WHERE course_name = ? LIMIT 1", (course_name,)).fetchone() is not None
+
+    def put_many(self, course_name, keys):
+        """Salva o aggiorna le chiavi indicate ({nome della chiave: (chiave, IV)}) in un'unica transazione."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO course_keys (course_name, key_name, sealed_key, sealed_iv, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(course_name, key_name, self._seal(course_name, key_name, key), self._seal(course_name, key_name, iv), now)
+                 for key_name, (key, iv) in keys.items()])
+
+
+class SheetsKeyStore(KeyStore):
+    """Archivio in sola lettura nei fogli ChiaviCorso scritti dai dispositivi su Google Drive."""
+
+    def __init__(self):
+        # I client di googleapiclient non sono thread-safe
+        self._lock = threading.Lock()
+        self._services = None
+
+    def load_course(self, course_name):
+        with self._lock:
+            if self._services is None:
+                self._services = getKIV.authenticate_google_services()
+            drive_service, sheets_service = self._services
+            folder_id = getKIV.find_or_create_folder(drive_service, course_name)
+            sheet_id = getKIV.find_or_create_sheet(drive_service, sheets_service, folder_id, "ChiaviCorso")
+            return getKIV.load_course_keys(sheets_service, sheet_id)
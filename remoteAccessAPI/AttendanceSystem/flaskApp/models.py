@@ -1,3 +1,4 @@
+import logging
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -14,3 +15,13 @@ class User(db.Model):
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
+
+def init_db():
+    # Crea lo schema e l'utente amministratore; va eseguita una sola volta all'avvio
+    db.create_all()
+    admin_exists = User.query.filter_by(username='admin').first()
+    if not admin_exists:
+        admin = User(username='admin', password='pass')
+        db.session.add(admin)
+        db.session.commit()
+        logging.info('Admin user and database tables created')
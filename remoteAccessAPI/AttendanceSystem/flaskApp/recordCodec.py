@@ -0,0 +1,32 @@
+import ast
+import base64
+
+# Formato compatto per ID cifrati, chiavi e IV: prefisso di versione seguito dai byte in base64.
+# Lo stesso modulo è presente nel backend del dispositivo e nell'API: le due copie devono restare identiche.
+FORMAT_V1 = 'v1:'
+
+
+def encode_bytes(data):
+    """Codifica dei byte nel formato compatto versionato (es. 'v1:q83v...')."""
+    return FORMAT_V1 + base64.b64encode(data).decode('ascii')
+
+
+def decode_bytes(text):
+    """
+    Decodifica una stringa prodotta da encode_bytes.
+
+    Accetta anche il formato precedente, cioè la rappresentazione Python di un oggetto
+    bytes (es. "b'\\x8f...'"), che viene letta senza eseguire codice.
+
+    Raises:
+        ValueError: Se la stringa non è in nessuno dei formati riconosciuti.
+    """
+    if text.startswith(FORMAT_V1):
+        return base64.b64decode(text[len(FORMAT_V1):], validate=True)
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError) as e:
+        raise ValueError(f"Formato non riconosciuto: {e}")
+    if not isinstance(value, bytes):
+        raise ValueError("Formato non riconosciuto: il valore non è di tipo bytes")
+    return value
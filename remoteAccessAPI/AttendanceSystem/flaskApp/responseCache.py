@@ -0,0 +1,92 @@
+import hashlib
+import functools
+import threading
+import logging
+from collections import OrderedDict
+from flask import request, make_response, current_app, g
+
+
+class BlockResponseCache:
+    """
+    Cache LRU delle risposte, valida finché non viene aggiunto un nuovo blocco.
+
+    La chiave comprende endpoint, argomenti della richiesta e numero dell'ultimo blocco,
+    quindi una risposta non viene mai riutilizzata dopo un cambio dei dati. La cache ha
+    un limite sul numero di voci e sulla memoria occupata dai corpi delle risposte.
+    Ogni risposta riceve un ETag, così che i client che ripetono la stessa richiesta con
+    If-None-Match ricevano un 304 senza corpo.
+
+    Gli attributi di flask.g indicati in g_attributes vengono salvati con la risposta e
+    ripristinati quando la risposta viene servita dalla cache, così che gli hook
+    after_request che li leggono si comportino come se la route fosse stata eseguita.
+    """
+
+    def __init__(self, block_number_provider, max_entries=1024, max_bytes=8 * 1024 * 1024, g_attributes=()):
+        self.block_number_provider = block_number_provider
+        self.g_attributes = tuple(g_attributes)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _put(self, key, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = entry
+            self._size += size
+            # Rimuove le voci usate meno di recente finché non si rientra nei limiti
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+    def cached(self, view):
+        """Decoratore per le route le cui risposte dipendono solo dagli argomenti e dallo stato della catena."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                block_number = self.block_number_provider()
+            except Exception as e:
+                logging.error(f"Error reading block number, response not cached: {e}")
+                return view(*args, **kwargs)
+
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))), block_number)
+            entry = self._get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                saved_g = {name: g.get(name) for name in self.g_attributes if name in g}
+                entry = (body, response.mimetype, hashlib.sha1(body).hexdigest(), saved_g)
+                self._put(key, entry)
+            else:
+                for name, value in entry[3].items():
+                    setattr(g, name, value)
+                response = current_app.response_class(entry[0], mimetype=entry[1])
+
+            response.set_etag(entry[2])
+            return response.make_conditional(request)
+        return wrapper
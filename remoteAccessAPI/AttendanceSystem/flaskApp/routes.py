@@ -1,46 +1,205 @@
-import subprocess
-import sys
-from flask import request, jsonify, render_template, redirect, url_for, session
+import io
+import csv
+import json
+import itertools
+from flask import request, jsonify, render_template, redirect, url_for, session, g, Response, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, set_access_cookies, unset_jwt_cookies
 from models import User, db
 import logging
-from blockchain import contract
+import getKIV
+from recordCodec import decode_bytes
+from batchDecrypt import BatchDecryptor
+from blockchain import web3, contract
+from responseCache import BlockResponseCache
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, padding
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 
-def decrypt_id_aes(ciphertext, iv, key):
-    cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
+# Numero massimo di ricerche in una richiesta a /batch_counts
+MAX_BATCH_QUERIES = 500
+OPERATION_TYPES = ("Registrazione", "Lezione", "Esame")
 
-    padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
-    
-    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-    plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
-    
-    return plaintext
+def validate_count_query(query):
+    """
+    Controlla una ricerca di /batch_counts e la converte in (operation, course, info).
 
-def execute_subprocess_command(comando):
-    process = subprocess.run(comando, capture_output=True, text=True)
-    if process.returncode == 0:
-        return process.stdout.strip()  # Restituisce l'output come stringa, senza spazi bianchi aggiuntivi
-    else:
-        raise Exception(f"Subprocess error: {process.stderr}")
+    Raises:
+        ValueError: Se la ricerca non è valida.
+    """
+    if not isinstance(query, dict):
+        raise ValueError('query must be an object')
+    operation_type, course_name, additional_info = query.get('operation'), query.get('course'), query.get('info', "")
+    if operation_type not in OPERATION_TYPES:
+        raise ValueError(f'operation must be one of {", ".join(OPERATION_TYPES)}')
+    if not isinstance(course_name, str) or not course_name:
+        raise ValueError('course is required')
+    if not isinstance(additional_info, str):
+        raise ValueError('info must be a string')
+    if operation_type != "Registrazione" and not additional_info:
+        raise ValueError('info is required for lessons and exams')
+    return operation_type, course_name, additional_info
+
+# Colonne dei record esportati
+EXPORT_FIELDS = ['operationType', 'courseName', 'additionalInfo', 'encryptedId', 'error']
+# Numero di record letti dal contract per ogni chiamata durante un'esportazione
+EXPORT_CHAIN_PAGE_SIZE = 200
+
+def iter_chain_records(operation_type, course_name, additional_info):
+    # Legge i record dal contract una pagina alla volta
+    offset = 0
+    while True:
+        page, next_offset = contract.functions.getRecordsByOperationPaged(operation_type, course_name, additional_info, offset, EXPORT_CHAIN_PAGE_SIZE).call()
+        for rec in page:
+            yield rec
+        if len(page) < EXPORT_CHAIN_PAGE_SIZE:
+            return
+        offset = next_offset
+
+# Numero di record decifrati insieme durante un'esportazione
+EXPORT_DECRYPT_CHUNK_SIZE = 500
+
+batch_decryptor = BatchDecryptor()
+
+def decrypt_batch(records, k, iv):
+    """
+    Decifra con la stessa chiave e lo stesso IV una lista di record.
+    Un record che non può essere decifrato viene restituito con il campo 'error'.
+    """
+    ciphertexts = []
+    for rec in records:
+        try:
+            ciphertexts.append(decode_bytes(rec[3]))
+        except ValueError:
+            ciphertexts.append(None)
+
+    items = []
+    failed = 0
+    for rec, (plaintext, error) in zip(records, batch_decryptor.decrypt(ciphertexts, k, iv)):
+        item = {'operationType': rec[0], 'courseName': rec[1], 'additionalInfo': rec[2], 'encryptedId': None}
+        if error is None:
+            try:
+                item['encryptedId'] = plaintext.decode('utf-8')
+            except UnicodeDecodeError:
+                error = 'invalid plaintext'
+        if error is not None:
+            failed += 1
+            item['error'] = 'Failed to decrypt or process record.'
+        items.append(item)
+    if failed:
+        logging.error(f"Failed to decrypt {failed} of {len(records)} records")
+    return items
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def decrypt_records(records, course_keys, chunk_size=EXPORT_DECRYPT_CHUNK_SIZE):
+    """
+    Decifra i record a gruppi di chunk_size, usando per ciascuno la chiave della sua operazione.
+    Un record che non può essere decifrato viene restituito con il campo 'error'.
+    """
+    parsed_keys = {}
+    for chunk in chunked(records, chunk_size):
+        # Nello stesso gruppo possono esserci record di lezioni o esami diversi
+        by_key = {}
+        for position, rec in enumerate(chunk):
+            by_key.setdefault(getKIV.key_name_for_operation(rec[0], rec[2]), []).append(position)
+
+        items = [None] * len(chunk)
+        for key_name, positions in by_key.items():
+            if key_name not in parsed_keys:
+                key, iv = course_keys.get(key_name, (None, None))
+                try:
+                    parsed_keys[key_name] = (decode_bytes(key), decode_bytes(iv)) if key and iv else None
+                except ValueError:
+                    parsed_keys[key_name] = None
+                if parsed_keys[key_name] is None:
+                    logging.error(f"Key not found for {key_name}")
+            if parsed_keys[key_name] is None:
+                decrypted = [{'operationType': chunk[position][0], 'courseName': chunk[position][1], 'additionalInfo': chunk[position][2],
+                              'encryptedId': None, 'error': 'Failed to decrypt or process record.'} for position in positions]
+            else:
+                k, iv = parsed_keys[key_name]
+                decrypted = decrypt_batch([chunk[position] for position in positions], k, iv)
+            for position, item in zip(positions, decrypted):
+                items[position] = item
+        for item in items:
+            yield item
+
+def ndjson_lines(items):
+    for item in items:
+        yield json.dumps(item) + '\n'
+
+def csv_lines(items):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for item in items:
+        writer.writerow(item)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # Un'esportazione vuota contiene comunque l'intestazione
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+# Dimensione predefinita e massima di una pagina di record
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def parse_pagination_args(args):
+    """
+    Legge i parametri di paginazione 'cursor' e 'limit' dalla query string.
+
+    Returns:
+        Tuple (offset, limit), oppure None se la richiesta non è paginata.
+
+    Raises:
+        ValueError: Se i parametri non sono interi validi.
+    """
+    if 'cursor' not in args and 'limit' not in args:
+        return None
+    offset = int(args.get('cursor') or 0)
+    limit = int(args.get('limit') or DEFAULT_PAGE_SIZE)
+    if offset < 0 or limit <= 0:
+        raise ValueError('cursor and limit must be positive integers')
+    return offset, min(limit, MAX_PAGE_SIZE)
 
 def configure_routes(app):
+    record_indexer = app.extensions['record_indexer']
+    key_service = app.extensions['key_service']
 
-    @app.before_request
-    def create_tables():
-        db.create_all()
-        admin_exists = User.query.filter_by(username='admin').first()
-        if not admin_exists:
-            admin = User(username='admin', password='pass')
-            db.session.add(admin)
-            db.session.commit()
-            logging.info('Admin user and database tables created')
+    def read_from_chain():
+        # Le risposte vengono lette dall'indice locale, salvo richiesta esplicita con ?source=chain
+        if request.args.get('source') == 'chain':
+            return True
+        g.served_from_index = True
+        return False
+
+    def latest_block_number():
+        # Le risposte lette dall'indice cambiano solo quando l'indicizzatore avanza
+        if request.args.get('source') == 'chain':
+            return web3.eth.block_number
+        return record_indexer.last_indexed_block()
+
+    response_cache = BlockResponseCache(latest_block_number,
+                                        max_entries=app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024),
+                                        max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', 8 * 1024 * 1024),
+                                        g_attributes=('served_from_index',))
+
+    @app.after_request
+    def add_index_lag_header(response):
+        if g.get('served_from_index'):
+            try:
+                response.headers['X-Index-Last-Block'] = str(record_indexer.last_indexed_block())
+            except Exception as e:
+                logging.error(f"Error reading indexer checkpoint: {e}")
+        return response
 
     @app.route('/')
     def home():
@@ -108,107 +267,171 @@ def configure_routes(app):
         logging.info(f'User {user_id} removed')
         return redirect(url_for('show_users'))
 
+    @app.route('/indexer_status', methods=['GET'])
+    @jwt_required()
+    def indexer_status():
+        return jsonify(record_indexer.status())
+
     @app.route('/count_registrations/<course_name>', methods=['GET'])
     @jwt_required()
+    @response_cache.cached
     def count_registrations(course_name):
-        count = contract.functions.countRegistrations(course_name).call()
+        if read_from_chain():
+            count = contract.functions.countRegistrations(course_name).call()
+        else:
+            count = record_indexer.count("Registrazione", course_name)
         logging.info(f'Queried registrations for {course_name}: {count}')
         return jsonify({'course_name': course_name, 'registrations': count})
 
     @app.route('/count_attendances/<course_name>/<lesson_name>', methods=['GET'])
     @jwt_required()
+    @response_cache.cached
     def count_lesson_attendances(course_name, lesson_name):
-        count = contract.functions.countLessonAttendances(course_name, lesson_name).call()
+        if read_from_chain():
+            count = contract.functions.countLessonAttendances(course_name, lesson_name).call()
+        else:
+            count = record_indexer.count("Lezione", course_name, lesson_name)
         logging.info(f'Queried attendances for course {course_name} and lesson {lesson_name}: {count}')
         return jsonify({'course_name': course_name, 'lesson_name': lesson_name, 'attendances': count})
 
     @app.route('/count_exam_participations/<course_name>/<exam_day>/<exam_month>/<exam_year>', methods=['GET'])
     @jwt_required()
+    @response_cache.cached
     def count_exam_participations(course_name, exam_day, exam_month, exam_year):
         exam_date = exam_day + "/" + exam_month + "/" + exam_year
-        count = contract.functions.countExamParticipations(course_name, exam_date).call()
+        if read_from_chain():
+            count = contract.functions.countExamParticipations(course_name, exam_date).call()
+        else:
+            count = record_indexer.count("Esame", course_name, exam_date)
         logging.info(f'Queried exam participations for course {course_name} on {exam_date}: {count}')
         return jsonify({'course_name': course_name, 'exam_date': exam_date, 'participations': count})
 
+    @app.route('/batch_counts', methods=['POST'])
+    @jwt_required()
+    def batch_counts():
+        payload = request.get_json(silent=True)
+        queries = payload.get('queries') if isinstance(payload, dict) else None
+        if not isinstance(queries, list):
+            return jsonify({'error': 'Expected a JSON object with a "queries" list.'}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per request.'}), 400
+
+        # Gli errori di una singola ricerca vengono riportati nel suo risultato senza bloccare le altre
+        results = [None] * len(queries)
+        valid = []
+        for position, query in enumerate(queries):
+            try:
+                valid.append((position, validate_count_query(query)))
+            except ValueError as e:
+                results[position] = {'query': query, 'error': str(e)}
+
+        if valid:
+            try:
+                if read_from_chain():
+                    operations, courses, infos = (list(values) for values in zip(*[query for _, query in valid]))
+                    counts = contract.functions.countRecordsBatch(operations, courses, infos).call()
+                else:
+                    counts = record_indexer.count_many([query for _, query in valid])
+            except Exception as e:
+                logging.error(f"Error resolving batch counts: {e}")
+                return jsonify({'error': 'Error resolving batch counts.'}), 500
+            for (position, query), count in zip(valid, counts):
+                results[position] = {'query': queries[position], 'count': count}
+
+        logging.info(f'Resolved {len(valid)} of {len(queries)} batch count queries')
+        return jsonify({'results': results})
+
     @app.route('/get_records_by_operation/<operation_type>/<course_name>/<additional_info>', methods=['GET'])
     @app.route('/get_records_by_operation/<operation_type>/<course_name>/<exam_day>/<exam_month>/<exam_year>', methods=['GET'])
     @jwt_required()
+    @response_cache.cached
     def get_records_by_operation(operation_type, course_name, additional_info=None, exam_day=None, exam_month=None, exam_year=None):
+        try:
+            pagination = parse_pagination_args(request.args)
+        except ValueError as e:
+            logging.error(f"Invalid pagination parameters: {e}")
+            return jsonify({'error': 'Invalid cursor or limit.'}), 400
+
+        next_cursor = None
         try:
             if operation_type == "Esame":
                 # Ricostruisce la data dell'esame dal giorno, mese e anno
                 if exam_day and exam_month and exam_year:
                     exam_date = f"{exam_day}/{exam_month}/{exam_year}"
-                    # Chiamata al contratto con la data dell'esame
-                    result = contract.functions.getRecordsByOperation(operation_type, course_name, exam_date).call()
-                    logging.info(f'Retrieved records for operation {operation_type} on course {course_name} with exam date {exam_date}')
                 else:
                     logging.error("Missing date parts for exam")
                     return jsonify({'error': 'Missing date parts for exam.'}), 400
+            info = exam_date if operation_type == "Esame" else additional_info
+
+            if pagination:
+                # Lettura di una sola pagina di record
+                offset, limit = pagination
+                # Un record in più del limite indica se esiste una pagina successiva,
+                # così l'ultima pagina piena non restituisce un cursore verso una pagina vuota
+                if read_from_chain():
+                    result, _ = contract.functions.getRecordsByOperationPaged(operation_type, course_name, info, offset, limit + 1).call()
+                else:
+                    result = record_indexer.get_records(operation_type, course_name, info, offset, limit + 1)
+                if len(result) > limit:
+                    result = result[:limit]
+                    next_cursor = str(offset + limit)
+                logging.info(f'Retrieved {len(result)} records from offset {offset} for operation {operation_type} on course {course_name} with info {info}')
+            elif read_from_chain():
+                result = contract.functions.getRecordsByOperation(operation_type, course_name, info).call()
+                logging.info(f'Retrieved records for operation {operation_type} on course {course_name} with info {info}')
             else:
-                # Chiamata al contratto con additional_info
-                result = contract.functions.getRecordsByOperation(operation_type, course_name, additional_info).call()
-                logging.info(f'Retrieved records for operation {operation_type} on course {course_name} with info {additional_info}')
+                result = record_indexer.get_records(operation_type, course_name, info)
+                logging.info(f'Retrieved indexed records for operation {operation_type} on course {course_name} with info {info}')
         except Exception as e:
             logging.error(f"Error calling Solidity function: {e}")
             return jsonify({'error': 'Error retrieving records from blockchain.'}), 500
 
-        # Log per verificare l'inizio del subprocesso
-        logging.info('Starting subprocess to retrieve key and IV')
-        
         try:
-            # Preparazione dei parametri per il comando subprocesso
-            op = str(operation_type)
-            cs = str(course_name)
-            ai = str(exam_date if operation_type == "Esame" else additional_info)
-
-            # Comando per eseguire lo script getKeyIV.py
-            comando = [sys.executable, "/Users/laplace/Desktop/Iots_Sdd_Project/remoteAccessAPI/AttendanceSystem/flaskApp/getKIV.py", op, cs, ai]
-            
-            # Esecuzione del comando subprocesso
-            keyChainResult = execute_subprocess_command(comando)
-            logging.info(f'Subprocess output: {keyChainResult}')  # Log dell'output del subprocesso
-
-            if not keyChainResult:
-                logging.error('Subprocess failed or returned empty result')
-                return jsonify({'error': 'Subprocess failed or returned empty result.'}), 500
-        except Exception as e:
-            logging.error(f"Error executing subprocess: {e}")
-            return jsonify({'error': 'Error executing subprocess.'}), 500
-
-        try:
-            resultski = keyChainResult.split()
-            if len(resultski) >= 2:
-                k, iv = eval(resultski[0]), eval(resultski[1])
+            ai = exam_date if operation_type == "Esame" else additional_info
+            resultKey, resultIV = key_service.get_key(operation_type, course_name, ai)
+            if resultKey and resultIV:
+                k, iv = decode_bytes(resultKey), decode_bytes(resultIV)
                 logging.info('Key and IV data successfully retrieved')
             else:
                 logging.info('Key and IV data not found')
                 return jsonify({'error': 'Dati Chiave ed IV non pervenuti.'}), 500
         except Exception as e:
-            logging.error(f"Error processing subprocess output: {e}")
-            return jsonify({'error': 'Error processing subprocess output.'}), 500
+            logging.error(f"Error retrieving key and IV: {e}")
+            return jsonify({'error': 'Error retrieving key and IV.'}), 500
+
+        # I record che non possono essere decifrati vengono restituiti con il campo 'error'
+        records = decrypt_batch(result, k, iv)
+
+        if pagination:
+            return jsonify({'records': records, 'next_cursor': next_cursor})
+        return jsonify(records)
+
+    @app.route('/export_records/<operation_type>/<course_name>', methods=['GET'])
+    @jwt_required()
+    def export_records(operation_type, course_name):
+        # Senza ?info= vengono esportati i record di tutte le lezioni o di tutti gli esami del corso
+        additional_info = request.args.get('info', "")
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({'error': 'format must be ndjson or csv.'}), 400
 
-        records = []
         try:
-            for rec in result:
-                try:
-                    encrypted_id = eval(rec[3])
-                    decrypted_id = decrypt_id_aes(encrypted_id, iv, k)
-                    decrypted_id_str = decrypted_id.decode('utf-8')
-                    records.append({
-                        'operationType': rec[0],
-                        'courseName': rec[1],
-                        'additionalInfo': rec[2],
-                        'encryptedId': decrypted_id_str
-                    })
-                except Exception as e:
-                    logging.error(f"Failed to decrypt or process record: {e}")
-                    return jsonify({'error': 'Failed to decrypt or process record.'}), 500
+            course_keys = key_service.get_course_keys(course_name)
         except Exception as e:
-            logging.error(f"Error processing records: {e}")
-            return jsonify({'error': 'Error processing records.'}), 500
+            logging.error(f"Error retrieving key and IV: {e}")
+            return jsonify({'error': 'Error retrieving key and IV.'}), 500
 
-        return jsonify(records)
+        if read_from_chain():
+            records = iter_chain_records(operation_type, course_name, additional_info)
+        else:
+            records = record_indexer.iter_records(operation_type, course_name, additional_info)
+        items = decrypt_records(records, course_keys)
+        logging.info(f'Streaming {export_format} export for operation {operation_type} on course {course_name} with info {additional_info}')
+
+        if export_format == 'csv':
+            return Response(stream_with_context(csv_lines(items)), mimetype='text/csv',
+                            headers={'Content-Disposition': f'attachment; filename="{course_name}_{operation_type}.csv"'})
+        return Response(stream_with_context(ndjson_lines(items)), mimetype='application/x-ndjson')
 
     from errors import configure_error_handlers
     configure_error_handlers(app)
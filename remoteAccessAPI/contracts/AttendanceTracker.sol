@@ -13,9 +13,63 @@ contract AttendanceTracker {
     // Array per memorizzare tutti i record
     Record[] private records;
 
+    // Posizioni dei record in 'records' per hash(operationType, courseName, additionalInfo)
+    mapping(bytes32 => uint[]) private recordsByOperation;
+    // Posizioni dei record in 'records' per hash(operationType, courseName)
+    mapping(bytes32 => uint[]) private recordsByCourse;
+
+    address public owner;
+    bool public migrationOpen;
+
     // Evento emesso ogni volta che un record viene creato
     event RecordCreated(string operationType, string courseName, string additionalInfo, string encryptedId);
 
+    constructor() {
+        owner = msg.sender;
+        migrationOpen = true;
+    }
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "Operazione riservata al proprietario del contratto");
+        _;
+    }
+
+    /**
+     * @dev Calcola la chiave dell'indice per tipo di operazione, corso e informazioni aggiuntive.
+     */
+    function operationKey(string memory operationType, string memory courseName, string memory additionalInfo) private pure returns (bytes32) {
+        return keccak256(abi.encode(operationType, courseName, additionalInfo));
+    }
+
+    /**
+     * @dev Calcola la chiave dell'indice per tipo di operazione e corso.
+     */
+    function courseKey(string memory operationType, string memory courseName) private pure returns (bytes32) {
+        return keccak256(abi.encode(operationType, courseName));
+    }
+
+    /**
+     * @dev Salva un record, aggiorna gli indici ed emette l'evento RecordCreated.
+     */
+    function storeRecord(Record memory record) private {
+        uint index = records.length;
+        records.push(record);
+        recordsByOperation[operationKey(record.operationType, record.courseName, record.additionalInfo)].push(index);
+        recordsByCourse[courseKey(record.operationType, record.courseName)].push(index);
+        emit RecordCreated(record.operationType, record.courseName, record.additionalInfo, record.encryptedId);
+    }
+
+    /**
+     * @dev Restituisce l'indice da usare per una ricerca.
+     * Le registrazioni e le ricerche senza informazioni aggiuntive usano l'indice per corso.
+     */
+    function matchingIndexes(string memory operationType, string memory courseName, string memory additionalInfo) private view returns (uint[] storage) {
+        if(bytes(additionalInfo).length == 0 || keccak256(bytes(operationType)) == keccak256(bytes("Registrazione"))) {
+            return recordsByCourse[courseKey(operationType, courseName)];
+        }
+        return recordsByOperation[operationKey(operationType, courseName, additionalInfo)];
+    }
+
     /**
      * @dev Aggiunge un nuovo record di presenza.
      * @param operationType Il tipo di operazione ("Registrazione", "Lezione", "Esame").
@@ -24,8 +78,44 @@ contract AttendanceTracker {
      * @param encryptedId L'ID criptato dello studente.
      */
     function addRecord(string memory operationType, string memory courseName, string memory additionalInfo, string memory encryptedId) public {
-        records.push(Record(operationType, courseName, additionalInfo, encryptedId));
-        emit RecordCreated(operationType, courseName, additionalInfo, encryptedId);
+        storeRecord(Record(operationType, courseName, additionalInfo, encryptedId));
+    }
+
+    /**
+     * @dev Aggiunge più record di presenza con un'unica transazione.
+     * @param newRecords I record da aggiungere; per ognuno viene emesso un evento RecordCreated.
+     */
+    function addRecords(Record[] memory newRecords) public {
+        for(uint i = 0; i < newRecords.length; i++) {
+            storeRecord(newRecords[i]);
+        }
+    }
+
+    /**
+     * @dev Importa i record di una versione precedente del contratto, nello stesso ordine.
+     * Disponibile solo per il proprietario e finché la migrazione non viene chiusa.
+     * @param oldRecords I record da importare.
+     */
+    function migrateRecords(Record[] memory oldRecords) public onlyOwner {
+        require(migrationOpen, "Migrazione chiusa");
+        for(uint i = 0; i < oldRecords.length; i++) {
+            storeRecord(oldRecords[i]);
+        }
+    }
+
+    /**
+     * @dev Chiude definitivamente la migrazione dei record.
+     */
+    function closeMigration() public onlyOwner {
+        migrationOpen = false;
+    }
+
+    /**
+     * @dev Restituisce il numero totale di record salvati.
+     * @return Il numero di record.
+     */
+    function recordCount() public view returns (uint) {
+        return records.length;
     }
 
     /**
@@ -34,13 +124,7 @@ contract AttendanceTracker {
      * @return Il numero di registrazioni trovate.
      */
     function countRegistrations(string memory courseName) public view returns (uint) {
-        uint count = 0;
-        for(uint i = 0; i < records.length; i++) {
-            if(keccak256(bytes(records[i].operationType)) == keccak256(bytes("Registrazione")) && keccak256(bytes(records[i].courseName)) == keccak256(bytes(courseName))) {
-                count++;
-            }
-        }
-        return count;
+        return recordsByCourse[courseKey("Registrazione", courseName)].length;
     }
 
     /**
@@ -50,15 +134,7 @@ contract AttendanceTracker {
      * @return Il numero di presenze trovate.
      */
     function countLessonAttendances(string memory courseName, string memory lessonName) public view returns (uint) {
-        uint count = 0;
-        for(uint i = 0; i < records.length; i++) {
-            if(keccak256(bytes(records[i].operationType)) == keccak256(bytes("Lezione")) &&
-            keccak256(bytes(records[i].additionalInfo)) == keccak256(bytes(lessonName)) &&
-            keccak256(bytes(records[i].courseName)) == keccak256(bytes(courseName))) {
-                count++;
-            }
-        }
-        return count;
+        return recordsByOperation[operationKey("Lezione", courseName, lessonName)].length;
     }
 
     /**
@@ -68,15 +144,24 @@ contract AttendanceTracker {
      * @return Il numero di partecipazioni trovate.
      */
     function countExamParticipations(string memory courseName, string memory examDate) public view returns (uint) {
-        uint count = 0;
-        for(uint i = 0; i < records.length; i++) {
-            if(keccak256(bytes(records[i].operationType)) == keccak256(bytes("Esame")) &&
-            keccak256(bytes(records[i].additionalInfo)) == keccak256(bytes(examDate)) &&
-            keccak256(bytes(records[i].courseName)) == keccak256(bytes(courseName))) {
-                count++;
-            }
+        return recordsByOperation[operationKey("Esame", courseName, examDate)].length;
+    }
+
+    /**
+     * @dev Conta i record di più ricerche con un'unica chiamata.
+     * Gli array devono avere la stessa lunghezza; l'elemento i-esimo di ciascuno descrive la ricerca i-esima.
+     * @param operationTypes I tipi di operazione ("Registrazione", "Lezione", "Esame").
+     * @param courseNames I nomi dei corsi.
+     * @param additionalInfos Le informazioni aggiuntive (es. nome della lezione o data dell'esame).
+     * @return Il numero di record trovati per ciascuna ricerca.
+     */
+    function countRecordsBatch(string[] memory operationTypes, string[] memory courseNames, string[] memory additionalInfos) public view returns (uint[] memory) {
+        require(operationTypes.length == courseNames.length && courseNames.length == additionalInfos.length, "Array di lunghezza diversa");
+        uint[] memory counts = new uint[](operationTypes.length);
+        for(uint i = 0; i < operationTypes.length; i++) {
+            counts[i] = matchingIndexes(operationTypes[i], courseNames[i], additionalInfos[i]).length;
         }
-        return count;
+        return counts;
     }
 
     /**
@@ -87,25 +172,41 @@ contract AttendanceTracker {
      * @return Un array di record filtrati in base ai criteri specificati.
      */
     function getRecordsByOperation(string memory operationType, string memory courseName, string memory additionalInfo) public view returns (Record[] memory) {
-        Record[] memory tempRecords = new Record[](records.length);
-        uint count = 0;
-        
-        for(uint i = 0; i < records.length; i++) {
-            bool matchOperationType = keccak256(bytes(records[i].operationType)) == keccak256(bytes(operationType));
-            bool matchCourseName = keccak256(bytes(records[i].courseName)) == keccak256(bytes(courseName));
-            bool matchAdditionalInfo = keccak256(bytes(records[i].additionalInfo)) == keccak256(bytes(additionalInfo)) || keccak256(bytes(additionalInfo)) == keccak256("");
-
-            if(matchOperationType && matchCourseName && (matchAdditionalInfo || keccak256(bytes(operationType)) == keccak256(bytes("Registrazione")))) {
-                tempRecords[count] = records[i];
-                count++;
-            }
-        }
-        
-        Record[] memory filteredRecords = new Record[](count);
-        for(uint j = 0; j < count; j++) {
-            filteredRecords[j] = tempRecords[j];
+        uint[] storage indexes = matchingIndexes(operationType, courseName, additionalInfo);
+        Record[] memory filteredRecords = new Record[](indexes.length);
+
+        for(uint i = 0; i < indexes.length; i++) {
+            filteredRecords[i] = records[indexes[i]];
         }
-        
+
         return filteredRecords;
     }
+
+    /**
+     * @dev Restituisce una pagina dei record che corrispondono ai criteri di ricerca.
+     * @param operationType Il tipo di operazione ("Registrazione", "Lezione", "Esame").
+     * @param courseName Il nome del corso.
+     * @param additionalInfo Informazioni aggiuntive (es. nome della lezione o data dell'esame).
+     * @param offset La posizione del primo record da restituire tra quelli corrispondenti.
+     * @param limit Il numero massimo di record da restituire.
+     * @return Un array con al massimo 'limit' record e la posizione da cui richiedere la pagina successiva
+     * (uguale al numero totale di record corrispondenti se non ci sono altre pagine).
+     */
+    function getRecordsByOperationPaged(string memory operationType, string memory courseName, string memory additionalInfo, uint offset, uint limit) public view returns (Record[] memory, uint) {
+        uint[] storage indexes = matchingIndexes(operationType, courseName, additionalInfo);
+        if(offset > indexes.length) {
+            offset = indexes.length;
+        }
+        uint end = indexes.length;
+        if(limit < end - offset) {
+            end = offset + limit;
+        }
+
+        Record[] memory page = new Record[](end - offset);
+        for(uint i = offset; i < end; i++) {
+            page[i - offset] = records[indexes[i]];
+        }
+
+        return (page, end);
+    }
 }
@@ -0,0 +1,95 @@
+import sys
+import json
+from web3 import Web3
+
+# Connessione a Ganache
+ganache_url = "http://localhost:7545"
+web3 = Web3(Web3.HTTPProvider(ganache_url))
+
+# Artifact generato da 'truffle compile' per la nuova versione del contract
+ARTIFACT_PATH = '/Users/laplace/Desktop/Iots_Sdd_Project/remoteAccessAPI/build/contracts/AttendanceTracker.json'
+# Numero massimo di record importati con una singola transazione; i gruppi vengono comunque
+# ridotti finché il gas stimato non rientra in BLOCK_GAS_SHARE del limite del blocco
+MIGRATION_BATCH_SIZE = 32
+# Margine applicato al gas stimato di una transazione
+GAS_MARGIN = 1.2
+# Frazione del limite di gas del blocco utilizzabile da una transazione, margine compreso
+BLOCK_GAS_SHARE = 0.9
+
+def load_contract_info(path, network_id='5777'):
+    """Restituisce ABI e indirizzo del contract dall'artifact di Truffle."""
+    with open(path, 'r') as file:
+        contract_data = json.load(file)
+    return contract_data['abi'], contract_data['networks'][network_id]['address']
+
+def read_old_records(old_contract):
+    """
+    Ricostruisce, nell'ordine originale, i record della versione precedente del contract
+    a partire dagli eventi RecordCreated, dato che l'array 'records' è privato.
+    """
+    event_topic = Web3.to_hex(Web3.keccak(text="RecordCreated(string,string,string,string)"))
+    logs = web3.eth.get_logs({
+        'address': old_contract.address,
+        'fromBlock': 0,
+        'toBlock': 'latest',
+        'topics': [event_topic]
+    })
+    records = []
+    for log in logs:
+        event = old_contract.events.RecordCreated().process_log(log)
+        args = event['args']
+        records.append((args['operationType'], args['courseName'], args['additionalInfo'], args['encryptedId']))
+    return records
+
+def migrate(old_address, close=False):
+    """
+    Copia i record del vecchio contract nel nuovo contract indicizzato.
+
+    La migrazione può essere ripresa: i record già presenti nel nuovo contract
+    (recordCount) vengono saltati. Per questo i dispositivi vanno collegati al nuovo
+    contract solo dopo la chiusura della migrazione.
+    """
+    abi, new_address = load_contract_info(ARTIFACT_PATH)
+    new_contract = web3.eth.contract(address=new_address, abi=abi)
+    # L'evento RecordCreated è invariato, quindi la nuova ABI basta anche per leggere il vecchio contract
+    old_contract = web3.eth.contract(address=Web3.to_checksum_address(old_address), abi=abi)
+    owner = new_contract.functions.owner().call()
+
+    records = read_old_records(old_contract)
+    already_migrated = new_contract.functions.recordCount().call()
+    print(f"Record nel vecchio contract: {len(records)}, già migrati: {already_migrated}")
+
+    budget = int(web3.eth.get_block('latest')['gasLimit'] * BLOCK_GAS_SHARE)
+    start = already_migrated
+    size = MIGRATION_BATCH_SIZE
+    while start < len(records):
+        batch = records[start:start + size]
+        function = new_contract.functions.migrateRecords(batch)
+        # Un gruppo che supera il limite del blocco viene ridotto e stimato di nuovo
+        try:
+            gas = int(function.estimate_gas({'from': owner}) * GAS_MARGIN)
+        except Exception:
+            if len(batch) == 1:
+                raise
+            size = len(batch) // 2
+            continue
+        if gas > budget:
+            if len(batch) == 1:
+                raise RuntimeError(f"Il record {start} richiede {gas} gas, oltre il limite di {budget}")
+            size = max(1, min(len(batch) // 2, len(batch) * budget // gas))
+            continue
+        tx_hash = function.transact({'from': owner, 'gas': gas})
+        web3.eth.wait_for_transaction_receipt(tx_hash)
+        start += len(batch)
+        print(f"Migrati {start} record su {len(records)}")
+
+    if close:
+        tx_hash = new_contract.functions.closeMigration().transact({'from': owner})
+        web3.eth.wait_for_transaction_receipt(tx_hash)
+        print("Migrazione chiusa.")
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [2, 3] or (len(sys.argv) == 3 and sys.argv[2] != '--close'):
+        print("Uso: python migrateRecords.py <indirizzo_vecchio_contract> [--close]")
+        sys.exit(1)
+    migrate(sys.argv[1], close=len(sys.argv) == 3)